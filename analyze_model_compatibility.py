@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 import os
 import onnx
+from pipeline_telemetry import start_stage
 
 # Путь к оптимизированной модели
 MODEL_PATH = os.path.join('Assets', 'StreamingAssets', 'model_simplified.onnx')
@@ -39,42 +40,60 @@ SUPPORTED_OPERATORS = {
     'Gemm', 'Clip', 'BatchNormalization', 'Shape', 'Erf', 'Resize', 'Pad', 'LSTM'
 }
 
-# Загрузка модели
-print(f"Загружаю модель из {MODEL_PATH}...")
-try:
-    model = onnx.load(MODEL_PATH)
-    print(f"Модель успешно загружена: {model.graph.name}")
-    
-    # Анализ операторов
-    ops = {}
-    unsupported_ops = {}
-    
-    for node in model.graph.node:
-        op_type = node.op_type
-        ops[op_type] = ops.get(op_type, 0) + 1
-        
-        if op_type not in SUPPORTED_OPERATORS:
-            unsupported_ops[op_type] = unsupported_ops.get(op_type, 0) + 1
-    
-    print("\nСтатистика операторов в модели:")
-    print(f"Всего операторов: {sum(ops.values())}")
-    print(f"Уникальных типов операторов: {len(ops)}")
-    
-    if unsupported_ops:
-        print("\n❌ ВНИМАНИЕ: Обнаружены неподдерживаемые операторы:")
-        for op, count in unsupported_ops.items():
-            print(f"  - {op}: {count} операторов")
-        print(f"\nВсего неподдерживаемых операторов: {sum(unsupported_ops.values())} из {sum(ops.values())} ({round(sum(unsupported_ops.values())/sum(ops.values())*100, 2)}%)")
-        print("Модель может не работать в Unity Sentis без дополнительной конвертации.")
-    else:
-        print("\n✅ Все операторы поддерживаются Unity Sentis!")
-        print("Модель должна быть совместима с Unity Sentis.")
-    
-    # Подробная информация по всем операторам
-    print("\nПолный список операторов в модели:")
-    for op, count in sorted(ops.items()):
-        status = "✅" if op in SUPPORTED_OPERATORS else "❌"
-        print(f"  - {status} {op}: {count}")
-    
-except Exception as e:
-    print(f"Ошибка при анализе модели: {e}") 
\ No newline at end of file
+
+def analyze_model(model_path=MODEL_PATH, telemetry=None):
+    """Проверяет, все ли операторы модели поддерживаются Unity Sentis.
+
+    Returns:
+        dict | None: Неподдерживаемые операторы и их количество, либо None при ошибке загрузки.
+    """
+    telemetry = start_stage(telemetry)
+    # Загрузка модели
+    print(f"Загружаю модель из {model_path}...")
+    try:
+        model = onnx.load(model_path)
+        print(f"Модель успешно загружена: {model.graph.name}")
+        telemetry.lap('load')
+        telemetry.record_model('input', model)
+
+        # Анализ операторов
+        ops = {}
+        unsupported_ops = {}
+
+        for node in model.graph.node:
+            op_type = node.op_type
+            ops[op_type] = ops.get(op_type, 0) + 1
+
+            if op_type not in SUPPORTED_OPERATORS:
+                unsupported_ops[op_type] = unsupported_ops.get(op_type, 0) + 1
+
+        print("\nСтатистика операторов в модели:")
+        print(f"Всего операторов: {sum(ops.values())}")
+        print(f"Уникальных типов операторов: {len(ops)}")
+
+        if unsupported_ops:
+            print("\n❌ ВНИМАНИЕ: Обнаружены неподдерживаемые операторы:")
+            for op, count in unsupported_ops.items():
+                print(f"  - {op}: {count} операторов")
+            print(f"\nВсего неподдерживаемых операторов: {sum(unsupported_ops.values())} из {sum(ops.values())} ({round(sum(unsupported_ops.values())/sum(ops.values())*100, 2)}%)")
+            print("Модель может не работать в Unity Sentis без дополнительной конвертации.")
+        else:
+            print("\n✅ Все операторы поддерживаются Unity Sentis!")
+            print("Модель должна быть совместима с Unity Sentis.")
+
+        # Подробная информация по всем операторам
+        print("\nПолный список операторов в модели:")
+        for op, count in sorted(ops.items()):
+            status = "✅" if op in SUPPORTED_OPERATORS else "❌"
+            print(f"  - {status} {op}: {count}")
+
+        telemetry.lap('transform')
+        telemetry.record(unsupported_ops=unsupported_ops)
+        return unsupported_ops
+    except Exception as e:
+        print(f"Ошибка при анализе модели: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    analyze_model()
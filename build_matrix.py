@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Матрица сборок: несколько моделей × несколько вариантов (opset, разрешение, точность).
+
+Каждая пара (модель, вариант) проходит полный конвейер подготовки
+(convert -> fix -> sort -> finalize) в отдельном процессе. Пары независимы,
+поэтому планировщик запускает их параллельно в пуле процессов, но не
+превышает заданный бюджет памяти: задача стартует, только если её оценка
+памяти помещается в остаток бюджета (одна задача запускается всегда).
+
+После подготовки артефакты по очереди замеряются onnxruntime (чтобы
+параллельные задачи не искажали задержку), и печатается сравнительная
+таблица: размер, число узлов, время подготовки, задержка и расхождение
+выхода с исходной моделью на том же разрешении.
+
+Спецификация вариантов - JSON файл или аргументы CLI:
+    {"opsets": [13, 15], "resolutions": [320, "512x384"], "precisions": ["fp32", "fp16"]}
+"""
+import contextlib
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import pipeline_telemetry
+from model_conversion_env.convert_to_onnx import export_variants
+from resolutions import parse_resolution
+
+DEFAULT_OUT_DIR = 'build_matrix'
+DEFAULT_SPEC = {'opsets': [13], 'resolutions': [320], 'precisions': ['fp32']}
+PRECISIONS = ('fp32', 'fp16')
+# convert_to_sentis_format поднимает opset ниже 13 до 13
+MIN_OPSET = 13
+
+# Оценка памяти задачи: базовая часть процесса + кратное размеру модели
+# (исходная модель, копии при преобразованиях, сессия onnxruntime для сверки)
+BASE_JOB_MEMORY_MB = 300
+MODEL_MEMORY_FACTOR = 6
+
+
+def load_spec(spec_path=None, opsets=None, resolutions=None, precisions=None):
+    """Собирает спецификацию вариантов из файла и/или аргументов CLI (аргументы важнее)."""
+    spec = dict(DEFAULT_SPEC)
+    if spec_path:
+        with open(spec_path, encoding='utf-8') as f:
+            spec.update(json.load(f))
+    if opsets:
+        spec['opsets'] = opsets
+    if resolutions:
+        spec['resolutions'] = resolutions
+    if precisions:
+        spec['precisions'] = precisions
+    for opset in spec['opsets']:
+        if int(opset) < MIN_OPSET:
+            raise ValueError(f"Конвейер Sentis требует opset >= {MIN_OPSET}, указан {opset}")
+    for precision in spec['precisions']:
+        if precision not in PRECISIONS:
+            raise ValueError(f"Неизвестная точность '{precision}', доступны: {', '.join(PRECISIONS)}")
+    return spec
+
+
+def expand_variants(spec):
+    """Декартово произведение спецификации в список вариантов."""
+    variants = []
+    for opset, resolution, precision in itertools.product(
+            spec['opsets'], spec['resolutions'], spec['precisions']):
+        height, width = parse_resolution(resolution)
+        variants.append({
+            'opset': int(opset),
+            'height': height,
+            'width': width,
+            'precision': precision,
+            'name': f"opset{opset}_{height}x{width}_{precision}",
+        })
+    return variants
+
+
+def estimate_job_memory_mb(model_path):
+    """Грубая оценка пикового потребления памяти задачей для планировщика."""
+    if os.path.isdir(model_path):
+        size = sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(model_path) for name in names)
+    else:
+        size = os.path.getsize(model_path)
+    return BASE_JOB_MEMORY_MB + MODEL_MEMORY_FACTOR * size / (1024 * 1024)
+
+
+def fix_input_shape(model, height, width, batch_size=1):
+    """Фиксирует форму входа [batch, channels, height, width] и сбрасывает выведенные формы."""
+    graph_input = model.graph.input[0]
+    dims = graph_input.type.tensor_type.shape.dim
+    if len(dims) != 4:
+        raise ValueError(f"Ожидался вход NCHW, получено измерений: {len(dims)}")
+    for dim, value in zip(dims, (batch_size, None, height, width)):
+        if value is not None:
+            dim.ClearField('dim_param')
+            dim.dim_value = value
+    # Формы промежуточных тензоров и выходов относились к старому разрешению
+    del model.graph.value_info[:]
+    for graph_output in model.graph.output:
+        for i, dim in enumerate(graph_output.type.tensor_type.shape.dim):
+            if i > 1:
+                dim.ClearField('dim_value')
+                dim.dim_param = f"{graph_output.name}_dim{i}"
+    return model
+
+
+def compress_weights_fp16(model, min_elements=16):
+    """Хранит веса float32 в float16 с Cast обратно в float32 перед использованием.
+
+    Вычисления остаются в float32 (как требует Sentis), а размер файла
+    уменьшается почти вдвое - аналог квантизации весов Sentis в Float16.
+    """
+    import numpy as np
+    from onnx import TensorProto, helper, numpy_helper
+
+    from graph_rewrite import GraphRewriter
+
+    rewriter = GraphRewriter(model)
+    # Инициализатор, перечисленный во входах графа, - значение по умолчанию для входа:
+    # после переименования вход float32 остался бы без инициализатора
+    graph_inputs = {value.name for value in model.graph.input}
+    cast_nodes = []
+    for initializer in model.graph.initializer:
+        if initializer.data_type != TensorProto.FLOAT or initializer.name in graph_inputs:
+            continue
+        array = numpy_helper.to_array(initializer)
+        if array.size < min_elements:
+            continue
+        name = initializer.name
+        fp16_name = rewriter.unique_name(f"{name}_fp16")
+        initializer.CopyFrom(numpy_helper.from_array(array.astype(np.float16), fp16_name))
+        cast_nodes.append(helper.make_node(
+            'Cast', [fp16_name], [name], to=TensorProto.FLOAT, name=rewriter.unique_name(f"{name}_cast")))
+
+    # Cast зависят только от инициализаторов, поэтому в начале графа порядок не нарушается
+    nodes = cast_nodes + list(model.graph.node)
+    del model.graph.node[:]
+    model.graph.node.extend(nodes)
+    return len(cast_nodes)
+
+
+def _prepare_source(model_path, variant, job_dir):
+    """Готовит исходную модель варианта: фиксированная форма и нужный opset."""
+    import onnx
+    from onnx import version_converter
+
+    model = onnx.load(model_path)
+    fix_input_shape(model, variant['height'], variant['width'])
+
+    current_opset = next((o.version for o in model.opset_import if o.domain in ('', 'ai.onnx')), None)
+    if current_opset != variant['opset']:
+        print(f"Конвертируем opset {current_opset} -> {variant['opset']}")
+        model = version_converter.convert_version(model, variant['opset'])
+
+    source_path = os.path.join(job_dir, 'source.onnx')
+    onnx.save(model, source_path)
+    return source_path
+
+
+def export_checkpoint(checkpoint_dir, export_dir, variants, run_id, run_log):
+    """Экспортирует локальный чекпоинт во все нужные вариантам пары (разрешение, opset).
+
+    Returns:
+        dict: (height, width, opset) -> путь к экспортированной ONNX модели.
+    """
+    resolutions = sorted({(v['height'], v['width']) for v in variants})
+    opsets = sorted({v['opset'] for v in variants})
+    telemetry = pipeline_telemetry.StageTelemetry(
+        'export', checkpoint_dir, run_id=run_id, log_path=run_log)
+    manifest = export_variants(checkpoint_dir, export_dir, resolutions, opsets, telemetry=telemetry)
+    telemetry.write(True)
+    return {(e['height'], e['width'], e['opset']): e['path'] for e in manifest['exports']}
+
+
+def _run_stage(name, func, input_path, output_path, job, **kwargs):
+    telemetry = pipeline_telemetry.StageTelemetry(
+        name, input_path, output_path, run_id=job['run_id'], log_path=job['run_log'])
+    ok = func(input_path, output_path, telemetry=telemetry, **kwargs)
+    record = telemetry.write(ok)
+    if not ok:
+        raise RuntimeError(f"Этап {name} завершился с ошибкой, см. {job['log_path']}")
+    return record
+
+
+def _parity(reference_path, artifact_path, height, width):
+    """Сравнивает выход артефакта с исходной моделью на одном тестовом входе."""
+    import numpy as np
+    from inspect_onnx_model import create_session, make_input_tensor, make_test_image
+
+    input_tensor = make_input_tensor(make_test_image(height, width))
+    outputs = []
+    for path in (reference_path, artifact_path):
+        session = create_session(path)
+        outputs.append(session.run(None, {session.get_inputs()[0].name: input_tensor})[0])
+    reference, artifact = outputs
+    if reference.shape != artifact.shape:
+        return {'parity_max_abs': None, 'parity_argmax': None}
+    result = {'parity_max_abs': float(np.abs(reference - artifact).max())}
+    if reference.ndim == 4 and reference.shape[1] > 1:
+        # Доля пикселей, где совпадает класс с максимальной вероятностью
+        result['parity_argmax'] = float((reference.argmax(1) == artifact.argmax(1)).mean())
+    else:
+        result['parity_argmax'] = None
+    return result
+
+
+def run_variant_job(job):
+    """Полный конвейер подготовки для одной пары (модель, вариант). Выполняется в процессе пула."""
+    from convert_to_sentis_format import convert_to_sentis_format
+    from final_preparation import final_preparation
+    from fix_topological_order import fix_topological_order
+    from fix_unsqueeze_operators import fix_unsqueeze_operators
+
+    variant = job['variant']
+    job_dir = job['job_dir']
+    os.makedirs(job_dir, exist_ok=True)
+    result = {'model': job['model_name'], 'source': job['model_path'],
+              **{k: variant[k] for k in ('name', 'opset', 'height', 'width', 'precision')}}
+    started = time.perf_counter()
+    peak_rss = []
+
+    try:
+        # Вывод этапов очень подробный, поэтому пишем его в журнал задачи
+        with open(job['log_path'], 'w', encoding='utf-8') as log, contextlib.redirect_stdout(log):
+            source = _prepare_source(job['model_path'], variant, job_dir)
+            steps = [
+                ('convert', convert_to_sentis_format, {}),
+                ('fix', fix_unsqueeze_operators, {}),
+                ('sort', fix_topological_order, {}),
+                ('finalize', final_preparation, {'main_model_path': None, 'opset': variant['opset']}),
+            ]
+            current = source
+            for name, func, kwargs in steps:
+                output = os.path.join(job_dir, f"{name}.onnx")
+                record = _run_stage(name, func, current, output, job, **kwargs)
+                peak_rss.append(record.get('process_peak_rss_bytes') or 0)
+                current = output
+
+            artifact = os.path.join(job_dir, 'model.onnx')
+            import onnx
+            model = onnx.load(current)
+            if variant['precision'] == 'fp16':
+                converted = compress_weights_fp16(model)
+                print(f"Веса float16: {converted} инициализаторов")
+            onnx.save(model, artifact)
+
+            result.update(_parity(source, artifact, variant['height'], variant['width']))
+
+        result.update({
+            'ok': True,
+            'artifact': artifact,
+            'size_bytes': os.path.getsize(artifact),
+            'nodes': len(model.graph.node),
+        })
+    except Exception as e:
+        result.update({'ok': False, 'error': str(e)})
+
+    result['prep_time_s'] = time.perf_counter() - started
+    result['peak_rss_bytes'] = max(peak_rss + [pipeline_telemetry.peak_rss_bytes() or 0])
+    return result
+
+
+def schedule_jobs(jobs, max_workers, memory_budget_mb):
+    """Запускает задачи в пуле процессов, соблюдая бюджет памяти.
+
+    Returns:
+        list[dict]: Результаты задач в порядке завершения.
+    """
+    pending = list(jobs)
+    running = {}
+    results = []
+    # Отдельный процесс на задачу: память onnx/onnxruntime гарантированно освобождается.
+    # max_tasks_per_child появился в Python 3.11; в более старых версиях процессы
+    # переиспользуются, и пиковая память задач может накапливаться
+    pool_options = {'max_tasks_per_child': 1} if sys.version_info >= (3, 11) else {}
+    with ProcessPoolExecutor(max_workers=max_workers, **pool_options) as pool:
+        while pending or running:
+            used = sum(running.values())
+            for job in list(pending):
+                if len(running) >= max_workers:
+                    break
+                if running and used + job['memory_mb'] > memory_budget_mb:
+                    continue
+                running[pool.submit(run_variant_job, job)] = job['memory_mb']
+                used += job['memory_mb']
+                pending.remove(job)
+                print(f"▶ {job['model_name']} [{job['variant']['name']}] "
+                      f"(~{job['memory_mb']:.0f} МБ, занято {used:.0f}/{memory_budget_mb} МБ)")
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                running.pop(future)
+                result = future.result()
+                status = "✅" if result['ok'] else f"❌ {result.get('error')}"
+                print(f"■ {result['model']} [{result['name']}] "
+                      f"{result['prep_time_s']:.1f} с {status}")
+                results.append(result)
+    return results
+
+
+def benchmark_results(results, runs, warmup, run_id, run_log):
+    """Последовательно замеряет задержку готовых артефактов."""
+    from inspect_onnx_model import benchmark_model
+
+    for result in results:
+        if not result['ok']:
+            continue
+        telemetry = pipeline_telemetry.StageTelemetry(
+            'bench', result['artifact'], run_id=run_id, log_path=run_log)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            stats = benchmark_model(result['artifact'], height=result['height'], width=result['width'],
+                                    warmup=warmup, runs=runs, telemetry=telemetry)
+        telemetry.write(True)
+        result['latency_ms'] = stats['median']
+        result['latency_p90_ms'] = stats['p90']
+
+
+def _fmt(value, pattern):
+    return pattern.format(value) if value is not None else '-'
+
+
+def print_table(results):
+    """Печатает сравнительную таблицу артефактов."""
+    header = (f"{'модель':<22} {'вариант':<24} {'размер, МБ':>10} {'узлы':>6} {'подг., с':>9} "
+              f"{'RSS, МБ':>8} {'медиана, мс':>11} {'p90, мс':>8} {'max|Δ|':>9} {'argmax':>7}")
+    print(header)
+    print('-' * len(header))
+    for result in sorted(results, key=lambda r: (r['model'], r['name'])):
+        name = result['model'][:22]
+        if not result['ok']:
+            print(f"{name:<22} {result['name']:<24} ❌ {result.get('error')}")
+            continue
+        print(f"{name:<22} {result['name']:<24} "
+              f"{result['size_bytes'] / (1024 * 1024):>10.2f} {result['nodes']:>6} "
+              f"{result['prep_time_s']:>9.1f} {result['peak_rss_bytes'] / (1024 * 1024):>8.0f} "
+              f"{_fmt(result.get('latency_ms'), '{:.2f}'):>11} {_fmt(result.get('latency_p90_ms'), '{:.2f}'):>8} "
+              f"{_fmt(result.get('parity_max_abs'), '{:.2e}'):>9} "
+              f"{_fmt(result.get('parity_argmax'), '{:.2%}'):>7}")
+
+
+def save_results(results, out_dir):
+    """Сохраняет результаты матрицы в JSON и CSV рядом с артефактами."""
+    json_path = os.path.join(out_dir, 'matrix_results.json')
+    with open(json_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    columns = ['model', 'source', 'name', 'opset', 'height', 'width', 'precision', 'ok', 'size_bytes', 'nodes',
+               'prep_time_s', 'peak_rss_bytes', 'latency_ms', 'latency_p90_ms',
+               'parity_max_abs', 'parity_argmax', 'artifact', 'error']
+    csv_path = os.path.join(out_dir, 'matrix_results.csv')
+    with open(csv_path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(results)
+    return json_path, csv_path
+
+
+def run_matrix(model_paths, spec, out_dir=DEFAULT_OUT_DIR, max_workers=None, memory_budget_mb=4096,
+               bench=True, runs=10, warmup=2, run_id=None, run_log=pipeline_telemetry.DEFAULT_RUN_LOG):
+    """Собирает все пары (модель × вариант) и печатает сравнительную таблицу.
+
+    Args:
+        model_paths (list[str]): ONNX файлы или локальные директории чекпоинтов.
+        spec (dict): Спецификация вариантов (opsets, resolutions, precisions).
+        out_dir (str): Директория для артефактов: <out_dir>/<модель>/<вариант>/model.onnx.
+        max_workers (int | None): Число процессов (по умолчанию - число ядер).
+        memory_budget_mb (int): Суммарный бюджет памяти параллельных задач.
+        bench (bool): Замерять ли задержку артефактов.
+
+    Returns:
+        list[dict]: Результаты по каждой паре.
+    """
+    run_id = run_id or pipeline_telemetry.new_run_id()
+    variants = expand_variants(spec)
+    max_workers = max_workers or os.cpu_count() or 1
+
+    jobs = []
+    for model_path in model_paths:
+        model_name = os.path.splitext(os.path.basename(os.path.normpath(model_path)))[0]
+        exports = {}
+        if os.path.isdir(model_path):
+            # Чекпоинт загружается один раз и экспортируется сразу во все разрешения и opset
+            exports = export_checkpoint(model_path, os.path.join(out_dir, model_name, 'export'),
+                                        variants, run_id, run_log)
+        memory_mb = estimate_job_memory_mb(model_path)
+        for variant in variants:
+            job_dir = os.path.join(out_dir, model_name, variant['name'])
+            jobs.append({
+                'model_path': exports.get((variant['height'], variant['width'], variant['opset']), model_path),
+                'model_name': model_name,
+                'variant': variant,
+                'job_dir': job_dir,
+                'log_path': os.path.join(job_dir, 'build.log'),
+                'memory_mb': memory_mb,
+                'run_id': run_id,
+                'run_log': os.path.abspath(run_log),
+            })
+    # Сначала крупные задачи: меньше простоя в конце, когда остаются только они
+    jobs.sort(key=lambda job: -job['memory_mb'])
+    for job in jobs:
+        os.makedirs(job['job_dir'], exist_ok=True)
+
+    print(f"Матрица сборок {run_id}: {len(model_paths)} моделей × {len(variants)} вариантов, "
+          f"процессов: {max_workers}, бюджет памяти: {memory_budget_mb} МБ")
+    started = time.perf_counter()
+    results = schedule_jobs(jobs, max_workers, memory_budget_mb)
+    print(f"Подготовка завершена за {time.perf_counter() - started:.1f} с")
+
+    if bench:
+        print("Замер задержки артефактов...")
+        benchmark_results(results, runs, warmup, run_id, run_log)
+
+    print()
+    print_table(results)
+    json_path, csv_path = save_results(results, out_dir)
+    print(f"\nРезультаты сохранены в {json_path} и {csv_path}")
+    return results
@@ -1,123 +1,101 @@
 #!/usr/bin/env python3
 import os
 import onnx
-from onnx import helper
-import numpy as np
-from onnx import numpy_helper
 import shutil
+from graph_rewrite import convert_opset, get_opset, prune_unused_opsets, set_opset
+from pipeline_telemetry import start_stage
 
 # Путь к модели и выходному файлу
 INPUT_MODEL = os.path.join('Assets', 'StreamingAssets', 'model_unity_ready.onnx')
 FINAL_MODEL_DIR = os.path.join('Assets', 'StreamingAssets')
 FINAL_MODEL = os.path.join(FINAL_MODEL_DIR, 'model_unity_final.onnx')
+MAIN_MODEL = os.path.join(FINAL_MODEL_DIR, 'model.onnx')
+OPSET_VERSION = 13
 
-print(f"Загружаю модель из {INPUT_MODEL}...")
-try:
-    # Загружаем модель
-    model = onnx.load(INPUT_MODEL)
-    print(f"Модель успешно загружена: {model.graph.name}")
-    
-    # 1. Исправляем Split операторы (проблема с атрибутом 'split')
-    nodes_to_fix = []
-    for node in model.graph.node:
-        if node.op_type == 'Split':
-            # Собираем информацию о проблемных атрибутах
-            has_split_attr = False
-            for attr in node.attribute:
-                if attr.name == 'split':
-                    has_split_attr = True
-                    break
-                    
-            if has_split_attr:
-                nodes_to_fix.append(node)
-    
-    if nodes_to_fix:
-        print(f"Найдено {len(nodes_to_fix)} Split операторов с проблемным атрибутом 'split'")
-        
-        for node in nodes_to_fix:
-            # Удаляем проблемный атрибут и заменяем через ConstantOfShape
-            split_attr = None
-            other_attrs = []
-            
-            for attr in node.attribute:
-                if attr.name == 'split':
-                    split_attr = attr
-                else:
-                    other_attrs.append(attr)
-            
-            if split_attr is not None:
-                # Удаляем все атрибуты
-                del node.attribute[:]
-                # Добавляем обратно только валидные атрибуты
-                node.attribute.extend(other_attrs)
-                print(f"Удален проблемный атрибут 'split' из узла {node.name}")
-    
-    # 2. Проверяем наличие других проблемных атрибутов в графе
-    for node in model.graph.node:
-        # Проверяем наличие и валидность атрибутов
-        for attr in list(node.attribute):
-            try:
-                if attr.name in ['axes', 'splits'] and hasattr(attr, 'ints') and len(attr.ints) == 0:
-                    # Удаляем пустые атрибуты
-                    node.attribute.remove(attr)
-                    print(f"Удален пустой атрибут '{attr.name}' из узла {node.name}")
-            except Exception as e:
-                print(f"Ошибка при обработке атрибута: {e}")
-    
-    # 3. Добавляем явную информацию об импорте opset - исправлено!
-    # Метод clear() не работает с RepeatedCompositeContainer из Google Protobuf
-    # Вместо того, чтобы очищать, создаем новую модель с нужным импортом opset
-    
-    # Создаем новый ONNX graph, копируя из оригинального
-    new_graph = helper.make_graph(
-        nodes=list(model.graph.node),
-        name=model.graph.name,
-        inputs=list(model.graph.input),
-        outputs=list(model.graph.output),
-        initializer=list(model.graph.initializer)
-    )
-    
-    # Создаем новую модель с правильным opset
-    new_model = helper.make_model(
-        new_graph,
-        producer_name="Unity Sentis Exporter",
-        opset_imports=[helper.make_opsetid("", 13)]  # Основной домен с версией 13
-    )
-    
-    # Копируем остальные поля из оригинальной модели
-    new_model.producer_version = "1.0"
-    new_model.doc_string = "ONNX model optimized for Unity Sentis 2.1.x"
-    if hasattr(model, 'domain'):
-        new_model.domain = "ai.onnx"
-    
-    # 4. Устанавливаем метаданные совместимости с Unity Sentis
-    # Это уже сделано при создании новой модели
-    
-    # 5. Сохраняем обработанную модель
-    print("Сохраняем финальную версию модели...")
-    onnx.save(new_model, FINAL_MODEL)
-    print(f"Финальная модель сохранена в {FINAL_MODEL}")
-    
-    # 6. Также копируем финальную модель в основной файл model.onnx
-    MAIN_MODEL = os.path.join(FINAL_MODEL_DIR, 'model.onnx')
-    shutil.copy2(FINAL_MODEL, MAIN_MODEL)
-    print(f"Модель также скопирована в {MAIN_MODEL} для использования в Unity")
-    
-    # 7. Проверяем модель на ошибки
-    print("\nПроверяем финальную модель на ошибки...")
+
+def final_preparation(input_path=INPUT_MODEL, output_path=FINAL_MODEL, main_model_path=MAIN_MODEL, telemetry=None,
+                      opset=OPSET_VERSION):
+    """Финальная очистка атрибутов и opset перед загрузкой модели в Unity."""
+    telemetry = start_stage(telemetry)
+    print(f"Загружаю модель из {input_path}...")
     try:
-        onnx.checker.check_model(new_model)
-        print("✅ Проверка успешна! Модель соответствует спецификации ONNX и готова для Unity Sentis.")
-    except Exception as check_error:
-        print(f"⚠️ ПРЕДУПРЕЖДЕНИЕ: Некоторые несоответствия всё ещё остались: {check_error}")
-        print("Однако, Unity Sentis может быть более толерантен к этим несоответствиям.")
-    
-    print("\n=== ИНСТРУКЦИИ ПО ИСПОЛЬЗОВАНИЮ МОДЕЛИ В UNITY ===")
-    print("1. Теперь при запуске проекта, Unity будет использовать обновлённую модель.")
-    print("2. Сериализуйте модель через Inspector: нажмите на model.onnx, затем кнопку 'Serialize To StreamingAssets'.")
-    print("3. Если Unity всё ещё не может загрузить модель, попробуйте:")
-    print("   - Убедитесь, что ссылка на файл модели правильная в коде.")
-    print("   - Возможно, потребуется еще больше оптимизации для использования с Sentis.")
-    
-except Exception as e:
-    print(f"Ошибка: {e}") 
\ No newline at end of file
+        # Загружаем модель
+        model = onnx.load(input_path)
+        print(f"Модель успешно загружена: {model.graph.name}")
+        telemetry.lap('load')
+        telemetry.record_model('input', model)
+
+        # 1. Приводим модель к нужному opset через onnx.version_converter и исправляем
+        # Split операторы (проблема с атрибутом 'split'): в opset 13+ размеры частей
+        # передаются входом. Атрибут переводим во вход, а не удаляем - иначе Split
+        # делил бы тензор на равные части
+        previous_opset = get_opset(model)
+        converted = convert_opset(model, opset)
+        if previous_opset != opset:
+            print(f"Модель сконвертирована: opset {previous_opset} -> {opset}")
+        for op_type, count in sorted(converted.items()):
+            print(f"Атрибуты переведены во входы: {op_type} - {count} узлов")
+
+        # 2. Проверяем наличие других проблемных атрибутов в графе
+        for node in model.graph.node:
+            # Проверяем наличие и валидность атрибутов
+            for attr in list(node.attribute):
+                try:
+                    if attr.name in ['axes', 'splits'] and hasattr(attr, 'ints') and len(attr.ints) == 0:
+                        # Удаляем пустые атрибуты
+                        node.attribute.remove(attr)
+                        print(f"Удален пустой атрибут '{attr.name}' из узла {node.name}")
+                except Exception as e:
+                    print(f"Ошибка при обработке атрибута: {e}")
+
+        # 3. Нормализуем импорт opset на месте (один основной домен '' нужной версии)
+        # и убираем импорты неиспользуемых доменов
+        set_opset(model, opset)
+        for domain in prune_unused_opsets(model):
+            print(f"Удален неиспользуемый импорт домена '{domain}'")
+
+        # 4. Устанавливаем метаданные совместимости с Unity Sentis
+        model.producer_name = "Unity Sentis Exporter"
+        model.producer_version = "1.0"
+        model.doc_string = "ONNX model optimized for Unity Sentis 2.1.x"
+        model.domain = "ai.onnx"
+
+        telemetry.lap('transform')
+
+        # 5. Сохраняем обработанную модель
+        print("Сохраняем финальную версию модели...")
+        onnx.save(model, output_path)
+        print(f"Финальная модель сохранена в {output_path}")
+
+        # 6. Также копируем финальную модель в основной файл model.onnx
+        if main_model_path:
+            shutil.copy2(output_path, main_model_path)
+            print(f"Модель также скопирована в {main_model_path} для использования в Unity")
+        telemetry.record_model('output', model)
+        telemetry.lap('save')
+
+        # 7. Проверяем модель на ошибки
+        print("\nПроверяем финальную модель на ошибки...")
+        try:
+            onnx.checker.check_model(model)
+            print("✅ Проверка успешна! Модель соответствует спецификации ONNX и готова для Unity Sentis.")
+        except Exception as check_error:
+            print(f"⚠️ ПРЕДУПРЕЖДЕНИЕ: Некоторые несоответствия всё ещё остались: {check_error}")
+            print("Однако, Unity Sentis может быть более толерантен к этим несоответствиям.")
+
+        print("\n=== ИНСТРУКЦИИ ПО ИСПОЛЬЗОВАНИЮ МОДЕЛИ В UNITY ===")
+        print("1. Теперь при запуске проекта, Unity будет использовать обновлённую модель.")
+        print("2. Сериализуйте модель через Inspector: нажмите на model.onnx, затем кнопку 'Serialize To StreamingAssets'.")
+        print("3. Если Unity всё ещё не может загрузить модель, попробуйте:")
+        print("   - Убедитесь, что ссылка на файл модели правильная в коде.")
+        print("   - Возможно, потребуется еще больше оптимизации для использования с Sentis.")
+
+        telemetry.lap('check')
+        return True
+    except Exception as e:
+        print(f"Ошибка: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    final_preparation()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Изменение графа ONNX на месте с сохранением порядка узлов.
+
+Раньше исправления удаляли узел и дописывали замену в конец graph.node,
+ломая топологический порядок (его потом чинил fix_topological_order.py),
+а final_preparation.py пересобирал всю модель ради смены opset. Здесь:
+
+- GraphRewriter.replace_node - замена узла на той же позиции;
+- GraphRewriter.add_constant - константа инициализатором или узлом
+  Constant прямо перед потребителем;
+- set_opset - смена импорта opset без копирования графа (номер версии,
+  без преобразования узлов);
+- convert_opset - настоящая смена версии через onnx.version_converter
+  (его адаптеры учитывают изменения смысла операторов, например axis у
+  Softmax/LogSoftmax/Hardmax в opset 13), результат копируется в ту же
+  модель;
+- upgrade_legacy_attributes - перевод оставшихся атрибутов во входы
+  (Unsqueeze/Squeeze/Split, Slice, Pad, Clip, Reduce*) у моделей, где номер
+  opset подняли без преобразования узлов. Меняются только затронутые
+  узлы, порядок сохраняется.
+"""
+from collections import Counter
+
+import numpy as np
+from onnx import helper, numpy_helper, version_converter
+
+DEFAULT_DOMAINS = ('', 'ai.onnx')
+
+# Атрибуты, ставшие входами: тип оператора -> (версия opset, [(атрибут, позиция входа, dtype)]).
+# Pad.value и Clip.min/max в старых версиях - float, поэтому константы float32.
+# Изменения смысла (Softmax axis в 13 и т.п.) по атрибутам не восстановить -
+# их обрабатывает только convert_opset через onnx.version_converter
+ATTRIBUTES_TO_INPUTS = {
+    'Slice': (10, [('starts', 1, np.int64), ('ends', 2, np.int64), ('axes', 3, np.int64)]),
+    'Pad': (11, [('pads', 1, np.int64), ('value', 2, np.float32)]),
+    'Clip': (11, [('min', 1, np.float32), ('max', 2, np.float32)]),
+    'Unsqueeze': (13, [('axes', 1, np.int64)]),
+    'Squeeze': (13, [('axes', 1, np.int64)]),
+    'Split': (13, [('split', 1, np.int64)]),
+    'ReduceSum': (13, [('axes', 1, np.int64)]),
+}
+for _op in ('ReduceMean', 'ReduceMax', 'ReduceMin', 'ReduceProd', 'ReduceL1', 'ReduceL2',
+            'ReduceLogSum', 'ReduceLogSumExp', 'ReduceSumSquare'):
+    ATTRIBUTES_TO_INPUTS[_op] = (18, [('axes', 1, np.int64)])
+
+
+def get_opset(model, domain=''):
+    """Версия opset домена (для основного домена учитывается и 'ai.onnx')."""
+    domains = DEFAULT_DOMAINS if domain in DEFAULT_DOMAINS else (domain,)
+    return next((o.version for o in model.opset_import if o.domain in domains), None)
+
+
+def set_opset(model, version, domain=''):
+    """Меняет импорт opset на месте; дубликаты домена ('' и 'ai.onnx') удаляются.
+
+    Returns:
+        int | None: Прежняя версия.
+    """
+    domains = DEFAULT_DOMAINS if domain in DEFAULT_DOMAINS else (domain,)
+    previous = get_opset(model, domain)
+    # clear() не работает с RepeatedCompositeContainer, удаляем по индексам с конца
+    matches = [i for i, o in enumerate(model.opset_import) if o.domain in domains]
+    for i in reversed(matches[1:]):
+        del model.opset_import[i]
+    if matches:
+        model.opset_import[matches[0]].domain = domain
+        model.opset_import[matches[0]].version = version
+    else:
+        model.opset_import.append(helper.make_opsetid(domain, version))
+    return previous
+
+
+def prune_unused_opsets(model):
+    """Удаляет импорты доменов, которые не использует ни один узел (основной домен остается)."""
+    used = {node.domain or '' for node in model.graph.node}
+    removed = []
+    for i in reversed(range(len(model.opset_import))):
+        domain = model.opset_import[i].domain
+        if domain not in DEFAULT_DOMAINS and domain not in used:
+            removed.append(domain)
+            del model.opset_import[i]
+    return removed
+
+
+def is_topologically_sorted(graph):
+    """Проверка за один проход: каждый вход узла уже определен выше по графу."""
+    available = {value.name for value in graph.input}
+    available.update(init.name for init in graph.initializer)
+    available.add('')
+    for node in graph.node:
+        if any(name not in available for name in node.input):
+            return False
+        available.update(node.output)
+    return True
+
+
+class GraphRewriter:
+    """Точечные изменения графа без пересборки.
+
+    Узлы Constant, добавленные перед потребителями, копятся и вставляются
+    в commit() от конца к началу, поэтому индексы, полученные до commit(),
+    остаются верными.
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.graph = model.graph
+        self._names = None
+        self._counter = 0
+        self._pending_nodes = []
+
+    def _all_names(self):
+        if self._names is None:
+            # Один проход по графу, только когда действительно нужно новое имя
+            names = {value.name for value in self.graph.input}
+            names.update(value.name for value in self.graph.output)
+            names.update(value.name for value in self.graph.value_info)
+            names.update(init.name for init in self.graph.initializer)
+            for node in self.graph.node:
+                names.update(node.input)
+                names.update(node.output)
+                names.add(node.name)
+            self._names = names
+        return self._names
+
+    def has_name(self, name):
+        return name in self._all_names()
+
+    def unique_name(self, base):
+        names = self._all_names()
+        name = base
+        while name in names:
+            self._counter += 1
+            name = f"{base}_{self._counter}"
+        names.add(name)
+        return name
+
+    def add_constant(self, base, array, before=None):
+        """Добавляет константу и возвращает имя её значения.
+
+        Args:
+            base (str): Основа имени.
+            array (np.ndarray): Значение.
+            before (int | None): Индекс потребителя: узел Constant встанет прямо
+                перед ним (после commit()). Если None - инициализатор, порядок
+                которых в ONNX не важен.
+        """
+        name = self.unique_name(base)
+        tensor = numpy_helper.from_array(np.asarray(array), name=name)
+        if before is None:
+            self.graph.initializer.append(tensor)
+        else:
+            node = helper.make_node('Constant', [], [name], name=self.unique_name(f"{name}_const"), value=tensor)
+            self._pending_nodes.append((before, node))
+        return name
+
+    def replace_node(self, index, node):
+        """Заменяет узел на той же позиции."""
+        self.graph.node[index].CopyFrom(node)
+
+    def attributes_to_inputs(self, index, spec, constants_as_nodes=False):
+        """Заменяет узел таким же, но с атрибутами из spec во входах-константах.
+
+        Args:
+            index (int): Индекс узла.
+            spec (list): [(атрибут, позиция входа, dtype)].
+            constants_as_nodes (bool): Константы узлами Constant перед узлом,
+                а не инициализаторами.
+
+        Returns:
+            bool: Был ли узел изменен.
+        """
+        node = self.graph.node[index]
+        attributes = {attr.name: attr for attr in node.attribute}
+        moved = {}
+        for attr_name, position, dtype in spec:
+            attr = attributes.get(attr_name)
+            if attr is None:
+                continue
+            value = helper.get_attribute_value(attr)
+            moved[position] = self.add_constant(f"{node.name or node.op_type}_{attr_name}",
+                                                np.array(value, dtype=dtype),
+                                                before=index if constants_as_nodes else None)
+        if not moved:
+            return False
+
+        moved_names = {attr_name for attr_name, _, _ in spec}
+        # Пропущенные необязательные входы между заданными обозначаются пустым именем
+        inputs = list(node.input) + [''] * (max(moved) + 1 - len(node.input))
+        for position, name in moved.items():
+            inputs[position] = name
+        replacement = helper.make_node(node.op_type, inputs, list(node.output), name=node.name,
+                                       domain=node.domain or None, doc_string=node.doc_string or None)
+        replacement.attribute.extend(attr for attr in node.attribute if attr.name not in moved_names)
+        self.replace_node(index, replacement)
+        return True
+
+    def commit(self):
+        """Вставляет отложенные узлы Constant перед их потребителями."""
+        # С конца, чтобы вставка не сдвигала ещё не обработанные индексы
+        for index, node in sorted(self._pending_nodes, key=lambda item: -item[0]):
+            self.graph.node.insert(index, node)
+        inserted = len(self._pending_nodes)
+        self._pending_nodes = []
+        return inserted
+
+
+def upgrade_legacy_attributes(model, target_version, constants_as_nodes=False):
+    """Переводит атрибуты, ставшие входами к target_version, во входы-константы.
+
+    Узел переводится, если оператор получил вход в версии <= target_version, а
+    у узла ещё есть соответствующий атрибут, - так бывает, когда номер opset
+    подняли без преобразования узлов. Номер opset не меняется.
+
+    Returns:
+        Counter: Число переведенных узлов по типам операторов.
+    """
+    rewriter = GraphRewriter(model)
+    converted = Counter()
+    for index, node in enumerate(model.graph.node):
+        if node.domain not in DEFAULT_DOMAINS or node.op_type not in ATTRIBUTES_TO_INPUTS:
+            continue
+        since_version, spec = ATTRIBUTES_TO_INPUTS[node.op_type]
+        if since_version <= target_version and rewriter.attributes_to_inputs(index, spec, constants_as_nodes):
+            converted[node.op_type] += 1
+    rewriter.commit()
+    return converted
+
+
+def convert_opset(model, target_version, constants_as_nodes=False):
+    """Переводит основной домен модели на target_version.
+
+    Если импортирована другая версия, модель конвертируется
+    onnx.version_converter (в обе стороны, с адаптерами изменений смысла) и
+    копируется обратно в model, так что ссылки вызывающего кода остаются
+    верными. Затем upgrade_legacy_attributes доводит узлы, которые остались в
+    атрибутной форме при уже поднятом номере opset.
+
+    Returns:
+        Counter: Число узлов, переведенных upgrade_legacy_attributes, по типам операторов.
+    """
+    current = get_opset(model)
+    if current is None:
+        # Узлов основного домена нет - преобразовывать нечего
+        set_opset(model, target_version)
+    elif current != target_version:
+        model.CopyFrom(version_converter.convert_version(model, target_version))
+    return upgrade_legacy_attributes(model, target_version, constants_as_nodes)
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Корпус предобработанных входов для бенчмарков, калибровки и сверок.
+
+Фотографии комнат декодируются один раз: каждая приводится к RGB,
+масштабируется под каждое целевое inputResolution, нормализуется так же,
+как в WallSegmentation.cs (ImageNet mean/std), и записывается в массив
+NCHW float32 или float16 (.npy, отображаемый в память). Рядом пишется
+corpus_manifest.json. Потребители читают кадры через InputCorpus без
+декодирования изображений, и время инференса больше не смешивается
+со временем PIL.
+
+Структура директории:
+    corpus_manifest.json          источники, нормализация, массивы по разрешениям
+    inputs_<h>x<w>_<dtype>.npy    [N, 3, h, w]
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+MANIFEST_NAME = 'corpus_manifest.json'
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+# Как в WallSegmentation.cs (TryCreateXRSimulationTensor)
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+# Значение WallSegmentation.inputResolution по умолчанию
+DEFAULT_RESOLUTIONS = ((512, 512),)
+
+
+def list_images(image_dir):
+    """Файлы изображений директории в детерминированном порядке."""
+    return sorted(name for name in os.listdir(image_dir)
+                  if name.lower().endswith(IMAGE_EXTENSIONS))
+
+
+def normalize_image(image, mean=IMAGENET_MEAN, std=IMAGENET_STD):
+    """uint8 HWC RGB -> float32 CHW с нормализацией по каналам."""
+    pixels = np.asarray(image, dtype=np.float32) * (1.0 / 255.0)
+    pixels = (pixels - np.asarray(mean, dtype=np.float32)) / np.asarray(std, dtype=np.float32)
+    return pixels.transpose(2, 0, 1)
+
+
+def array_name(height, width, dtype):
+    return f"inputs_{height}x{width}_{np.dtype(dtype).name}.npy"
+
+
+def _normalization_from_export(export_manifest):
+    """mean/std из export_manifest.json (их туда пишет convert_to_onnx.export_variants)."""
+    with open(export_manifest, encoding='utf-8') as f:
+        manifest = json.load(f)
+    mean = manifest.get('image_mean') or IMAGENET_MEAN
+    std = manifest.get('image_std') or IMAGENET_STD
+    return tuple(mean), tuple(std)
+
+
+def build_corpus(image_dir, output_dir, resolutions=DEFAULT_RESOLUTIONS, dtype='float32',
+                 mean=IMAGENET_MEAN, std=IMAGENET_STD, export_manifest=None, telemetry=None):
+    """Декодирует директорию фотографий один раз и записывает входы для всех разрешений.
+
+    Args:
+        image_dir (str): Директория с фотографиями.
+        output_dir (str): Директория корпуса.
+        resolutions (iterable): Пары (высота, ширина).
+        dtype (str): 'float32' или 'float16'.
+        mean (tuple): Среднее по каналам RGB.
+        std (tuple): Стандартное отклонение по каналам RGB.
+        export_manifest (str | None): Взять mean/std из манифеста экспорта модели.
+        telemetry (StageTelemetry | None): Куда записать метрики сборки.
+
+    Returns:
+        dict | None: Манифест корпуса или None при ошибке.
+    """
+    from PIL import Image
+
+    if export_manifest:
+        mean, std = _normalization_from_export(export_manifest)
+    dtype = np.dtype(dtype)
+    if dtype not in (np.float32, np.float16):
+        print(f"Ошибка: поддерживаются float32 и float16, указан {dtype}")
+        return None
+    names = list_images(image_dir)
+    if not names:
+        print(f"Ошибка: в {image_dir} нет изображений ({', '.join(IMAGE_EXTENSIONS)})")
+        return None
+    resolutions = [tuple(r) for r in resolutions]
+    os.makedirs(output_dir, exist_ok=True)
+    if telemetry is not None:
+        telemetry.lap('load')
+
+    print(f"Корпус: {len(names)} изображений из {image_dir}, разрешения: "
+          f"{', '.join(f'{h}x{w}' for h, w in resolutions)}, {dtype.name}")
+    arrays = {
+        (height, width): np.lib.format.open_memmap(
+            os.path.join(output_dir, array_name(height, width, dtype)), mode='w+',
+            dtype=dtype, shape=(len(names), 3, height, width))
+        for height, width in resolutions
+    }
+
+    frames = []
+    for i, name in enumerate(names):
+        with Image.open(os.path.join(image_dir, name)) as image:
+            image = image.convert('RGB')
+            frames.append({'id': os.path.splitext(name)[0], 'file': name,
+                           'width': image.width, 'height': image.height})
+            for (height, width), array in arrays.items():
+                resized = image.resize((width, height), Image.BILINEAR)
+                array[i] = normalize_image(resized, mean, std)
+    for array in arrays.values():
+        array.flush()
+
+    manifest = {
+        'source_dir': os.path.abspath(image_dir),
+        'dtype': dtype.name,
+        'layout': 'NCHW',
+        'color': 'RGB',
+        'mean': list(mean),
+        'std': list(std),
+        'frames': frames,
+        'arrays': {f"{h}x{w}": array_name(h, w, dtype) for h, w in resolutions},
+    }
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    total_bytes = sum(array.nbytes for array in arrays.values())
+    print(f"Корпус сохранен в {output_dir}: {total_bytes / (1024 * 1024):.1f} МБ")
+    if telemetry is not None:
+        telemetry.lap('transform')
+        telemetry.record(frames=len(names), corpus_bytes=total_bytes,
+                         resolutions=list(manifest['arrays']), dtype=dtype.name)
+    return manifest
+
+
+class InputCorpus:
+    """Чтение корпуса без декодирования: массивы отображаются в память.
+
+    Args:
+        path (str): Директория корпуса (с corpus_manifest.json).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST_NAME), encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self._arrays = {}
+
+    def __len__(self):
+        return len(self.manifest['frames'])
+
+    def frame_ids(self):
+        return [frame['id'] for frame in self.manifest['frames']]
+
+    def resolutions(self):
+        return [tuple(int(v) for v in key.split('x')) for key in self.manifest['arrays']]
+
+    def array(self, height, width):
+        """Массив [N, 3, height, width] в исходном dtype корпуса (memmap, только чтение)."""
+        key = f"{height}x{width}"
+        if key not in self.manifest['arrays']:
+            raise KeyError(f"В корпусе нет разрешения {key}, доступны: {', '.join(self.manifest['arrays'])}")
+        if key not in self._arrays:
+            self._arrays[key] = np.load(os.path.join(self.path, self.manifest['arrays'][key]), mmap_mode='r')
+        return self._arrays[key]
+
+    def batches(self, height, width, batch_size=1, dtype=np.float32):
+        """Генерирует (идентификаторы кадров, тензор [batch, 3, h, w]).
+
+        Если dtype совпадает с dtype корпуса, тензор - срез memmap без копирования;
+        иначе (корпус float16, модель float32) копируется только текущий батч.
+        """
+        array = self.array(height, width)
+        ids = self.frame_ids()
+        for start in range(0, len(ids), batch_size):
+            batch = array[start:start + batch_size]
+            if batch.dtype != dtype:
+                batch = batch.astype(dtype)
+            yield ids[start:start + batch_size], batch
+
+    def frames(self, height, width, dtype=np.float32):
+        """Генерирует (идентификатор кадра, тензор [1, 3, h, w])."""
+        for ids, batch in self.batches(height, width, 1, dtype):
+            yield ids[0], batch
+
+
+def parse_args():
+    from resolutions import parse_resolution
+
+    parser = argparse.ArgumentParser(description="Сборка корпуса предобработанных входов")
+    parser.add_argument('images', help="директория с фотографиями")
+    parser.add_argument('output', help="директория корпуса")
+    parser.add_argument('--resolutions', nargs='+', default=['512'], help="например 320 512 512x384")
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default='float32')
+    parser.add_argument('--export-manifest', default=None,
+                        help="взять mean/std из export_manifest.json вместо ImageNet")
+    args = parser.parse_args()
+    args.resolutions = [parse_resolution(r) for r in args.resolutions]
+    return args
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    build_corpus(args.images, args.output, args.resolutions, args.dtype,
+                 export_manifest=args.export_manifest)
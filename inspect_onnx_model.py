@@ -2,13 +2,16 @@ import onnxruntime as ort
 import numpy as np
 import os
 import time
-from PIL import Image
-import matplotlib.pyplot as plt
-from matplotlib import colors
-import random
+from pipeline_telemetry import start_stage
+
+MODEL_PATH = "Assets/Models/model_unity_final.onnx"
 
 def visualize_segmentation(output, output_path="segmentation_visualization.png"):
     """Визуализирует результаты сегментации."""
+    # matplotlib нужен только для визуализации, не тянем его при запуске
+    import matplotlib.pyplot as plt
+    from matplotlib import colors
+
     # Для вывода используем первый батч
     if len(output.shape) == 4:  # [batch, classes, height, width]
         # Получаем индексы классов с максимальной вероятностью для каждого пикселя
@@ -42,13 +45,43 @@ def visualize_segmentation(output, output_path="segmentation_visualization.png")
     print(f"Визуализация сохранена в {output_path}")
     plt.close()
 
-def print_model_info(model_path):
-    """Печатает основную информацию о модели ONNX."""
+def create_session(model_path, intra_op_threads=None):
+    """Создает сессию onnxruntime для инференса на CPU."""
+    options = ort.SessionOptions()
+    if intra_op_threads:
+        options.intra_op_num_threads = intra_op_threads
+    return ort.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+
+def make_test_image(height, width, num_channels=3):
+    """Генерирует тестовое изображение - градиент в формате HWC."""
+    rows = np.arange(height, dtype=np.float32)[:, None]
+    cols = np.arange(width, dtype=np.float32)[None, :]
+    test_image = np.zeros((height, width, num_channels), dtype=np.float32)
+    # Создаем градиенты по x и y
+    test_image[:, :, 0] = rows / height  # R - по вертикали
+    test_image[:, :, 1] = cols / width   # G - по горизонтали
+    test_image[:, :, 2] = (rows + cols) / (height + width)  # B - диагональ
+    return test_image
+
+def make_input_tensor(test_image):
+    """Преобразует изображение HWC в тензор [batch, channels, height, width]."""
+    input_tensor = np.transpose(test_image, (2, 0, 1))  # CHW формат
+    input_tensor = np.expand_dims(input_tensor, axis=0)  # Добавляем измерение batch
+    return input_tensor.astype(np.float32)
+
+def print_model_info(model_path, run_inference=True):
+    """Печатает основную информацию о модели ONNX.
+
+    Args:
+        model_path (str): Путь к модели ONNX.
+        run_inference (bool): Если False, выводятся только метаданные и входы/выходы,
+            без тестового инференса и визуализации.
+    """
     print(f"Анализ модели: {model_path}")
     print("-" * 50)
     
     # Создаем сессию для инференса
-    session = ort.InferenceSession(model_path)
+    session = create_session(model_path)
     
     # Получаем метаданные модели
     metadata = session.get_modelmeta()
@@ -77,6 +110,9 @@ def print_model_info(model_path):
         print(f"      Форма: {output_node.shape}")
         print(f"      Тип: {output_node.type}")
     
+    if not run_inference:
+        return
+    
     # Генерируем статический размер входных данных для теста
     print("\nОпределение размеров входных данных для теста:")
     # Для модели семантической сегментации изображений
@@ -91,25 +127,17 @@ def print_model_info(model_path):
     input_name = session.get_inputs()[0].name
     
     # Генерируем тестовое изображение - градиент
-    test_image = np.zeros((height, width, num_channels), dtype=np.float32)
-    for i in range(height):
-        for j in range(width):
-            # Создаем градиенты по x и y
-            test_image[i, j, 0] = i / height  # R - по вертикали
-            test_image[i, j, 1] = j / width   # G - по горизонтали
-            test_image[i, j, 2] = (i + j) / (height + width)  # B - диагональ
+    test_image = make_test_image(height, width, num_channels)
     
     # Преобразуем в формат, требуемый моделью [batch, channels, height, width]
-    input_tensor = np.transpose(test_image, (2, 0, 1))  # CHW формат
-    input_tensor = np.expand_dims(input_tensor, axis=0)  # Добавляем измерение batch
-    
     input_data = {
-        input_name: input_tensor.astype(np.float32)
+        input_name: make_input_tensor(test_image)
     }
     
     print(f"  {input_name}: shape = {input_data[input_name].shape}, dtype = {input_data[input_name].dtype}")
     
     # Сохраняем тестовое изображение для справки
+    from PIL import Image
     test_img_pil = Image.fromarray((test_image * 255).astype(np.uint8))
     test_img_path = "test_input_image.png"
     test_img_pil.save(test_img_path)
@@ -190,18 +218,10 @@ void ProcessModelOutput(Tensor<float> outputTensor)
                 print(f"Тест с размером {height}x{width}:")
                 
                 # Создаем новое тестовое изображение
-                test_image = np.zeros((height, width, num_channels), dtype=np.float32)
-                for i in range(height):
-                    for j in range(width):
-                        test_image[i, j, 0] = i / height
-                        test_image[i, j, 1] = j / width
-                        test_image[i, j, 2] = (i + j) / (height + width)
-                
-                input_tensor = np.transpose(test_image, (2, 0, 1))
-                input_tensor = np.expand_dims(input_tensor, axis=0)
+                test_image = make_test_image(height, width, num_channels)
                 
                 input_data = {
-                    input_name: input_tensor.astype(np.float32)
+                    input_name: make_input_tensor(test_image)
                 }
                 
                 outputs = session.run(None, input_data)
@@ -213,13 +233,81 @@ void ProcessModelOutput(Tensor<float> outputTensor)
             except Exception as e:
                 print(f"  Ошибка: {e}")
 
-def main():
-    model_path = "Assets/Models/model_unity_final.onnx"
+def benchmark_model(model_path, height=320, width=320, warmup=3, runs=20, intra_op_threads=None, telemetry=None,
+                    corpus=None):
+    """Замеряет время инференса модели на тестовом изображении или кадрах корпуса.
+
+    Args:
+        model_path (str): Путь к модели ONNX.
+        height (int): Высота входного изображения.
+        width (int): Ширина входного изображения.
+        warmup (int): Количество прогревочных запусков, не входящих в статистику.
+        runs (int): Количество замеряемых запусков.
+        intra_op_threads (int | None): Число потоков внутри оператора (None - по умолчанию).
+        telemetry (StageTelemetry | None): Куда записать метрики бенчмарка.
+        corpus (str | None): Директория корпуса input_corpus.py; кадры разрешения
+            height x width подаются по кругу.
+
+    Returns:
+        dict | None: Время инференса в миллисекундах (mean, median, p90, min, max)
+            или None, если корпус пуст.
+    """
+    telemetry = start_stage(telemetry)
+    session = create_session(model_path, intra_op_threads)
+    input_name = session.get_inputs()[0].name
+    if corpus is None:
+        inputs = [make_input_tensor(make_test_image(height, width))]
+    else:
+        from input_corpus import InputCorpus
+        frames = InputCorpus(corpus)
+        if len(frames) == 0:
+            print(f"Ошибка: корпус {corpus} пуст, нет кадров для бенчмарка")
+            return None
+        array = frames.array(height, width)
+        inputs = [array[i:i + 1] for i in range(len(array))]  # срезы memmap, без копирования
+    telemetry.lap('load')
+    
+    def next_input(i):
+        # Приведение float16 корпуса к float32 делаем вне замера
+        batch = inputs[i % len(inputs)]
+        return {input_name: batch if batch.dtype == np.float32 else batch.astype(np.float32)}
+    
+    print(f"Бенчмарк модели: {model_path}")
+    print(f"  Вход: {inputs[0].shape}, кадров: {len(inputs)}, прогрев: {warmup}, запусков: {runs}")
+    
+    for i in range(warmup):
+        session.run(None, next_input(i))
+    telemetry.lap('warmup')
+    
+    timings = []
+    for i in range(runs):
+        input_data = next_input(i)
+        start_time = time.perf_counter()
+        session.run(None, input_data)
+        timings.append((time.perf_counter() - start_time) * 1000.0)
+    
+    timings = np.array(timings)
+    stats = {
+        "mean": float(timings.mean()),
+        "median": float(np.median(timings)),
+        "p90": float(np.percentile(timings, 90)),
+        "min": float(timings.min()),
+        "max": float(timings.max()),
+    }
+    telemetry.lap('run')
+    telemetry.record(latency_ms=stats["median"], latency_stats_ms=stats,
+                     input_shape=list(inputs[0].shape), input_frames=len(inputs))
+    print(f"  Среднее: {stats['mean']:.2f} мс, медиана: {stats['median']:.2f} мс, p90: {stats['p90']:.2f} мс")
+    print(f"  Мин: {stats['min']:.2f} мс, Макс: {stats['max']:.2f} мс")
+    return stats
+
+def main(model_path=MODEL_PATH, run_inference=True):
     if not os.path.exists(model_path):
         print(f"Ошибка: Файл модели не найден: {model_path}")
-        return
+        return False
     
-    print_model_info(model_path)
+    print_model_info(model_path, run_inference=run_inference)
+    return True
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,410 @@
+#!/usr/bin/env python3
+"""
+Компактное хранилище масок и логитов сегментации для офлайн прогонов и эталонов.
+
+Вместо PNG через matplotlib (visualize_segmentation) или сырых логитов
+float32 (150×128×128 на кадр ≈ 9.4 МБ) хранилище держит:
+
+- бинарные маски (стена, пол, ...) - упакованные биты или RLE, что короче;
+- top-k логитов в float16 и индексы их классов в uint8 - в файлах
+  фиксированной записи, отображаемых в память (np.memmap) и растущих
+  блоками, поэтому кадр читается без копирования и декодирования;
+- индекс index.json для произвольного доступа по идентификатору кадра.
+
+При k=3 и выходе 128×128 кадр занимает ~147 КБ логитов и ~2 КБ на маску,
+то есть тысячи эталонных кадров помещаются в несколько сотен МБ.
+
+Структура директории:
+    index.json        метаданные и индекс кадров
+    topk_values.f16   [capacity, k, H, W] float16
+    topk_indices.u8   [capacity, k, H, W] uint8 (uint16, если классов больше 256)
+    masks.bin         закодированные маски подряд
+"""
+import json
+import os
+
+import numpy as np
+
+from model_classes import ADE20K_CLASSES
+
+INDEX_NAME = 'index.json'
+VALUES_NAME = 'topk_values.f16'
+INDICES_NAME = 'topk_indices.u8'
+MASKS_NAME = 'masks.bin'
+FORMAT_VERSION = 1
+
+# Маски, которые нужны приложению для перекраски
+DEFAULT_MASK_CLASSES = {'wall': ADE20K_CLASSES.index('wall'), 'floor': ADE20K_CLASSES.index('floor')}
+
+
+def encode_mask(mask):
+    """Кодирует бинарную маску: упакованные биты или RLE, что короче.
+
+    Returns:
+        tuple[str, bytes]: Кодек ('bits', 'rle16', 'rle32') и данные.
+    """
+    flat = np.ascontiguousarray(mask, dtype=bool).reshape(-1)
+    bits = np.packbits(flat).tobytes()
+
+    # Длины чередующихся серий, начиная с нулей (первая серия может быть пустой)
+    changes = np.flatnonzero(flat[1:] != flat[:-1]) + 1
+    bounds = np.concatenate(([0], changes, [flat.size]))
+    runs = np.diff(bounds)
+    if flat.size and flat[0]:
+        runs = np.concatenate(([0], runs))
+    if runs.size and runs.max() >= 1 << 16:
+        codec, rle = 'rle32', runs.astype('<u4').tobytes()
+    else:
+        codec, rle = 'rle16', runs.astype('<u2').tobytes()
+
+    if len(rle) < len(bits):
+        return codec, rle
+    return 'bits', bits
+
+
+def decode_mask(codec, data, shape):
+    """Восстанавливает бинарную маску формы shape."""
+    size = int(np.prod(shape))
+    if codec == 'bits':
+        return np.unpackbits(np.frombuffer(data, dtype=np.uint8), count=size).astype(bool).reshape(shape)
+    runs = np.frombuffer(data, dtype='<u2' if codec == 'rle16' else '<u4')
+    values = np.arange(runs.size) % 2 == 1
+    return np.repeat(values, runs).reshape(shape)
+
+
+def topk_logits(logits, k):
+    """Top-k классов по каждому пикселю для логитов [classes, H, W].
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Индексы классов [k, H, W] и значения [k, H, W],
+        отсортированные по убыванию.
+    """
+    top = np.argpartition(-logits, k - 1, axis=0)[:k]
+    values = np.take_along_axis(logits, top, axis=0)
+    order = np.argsort(-values, axis=0)
+    return np.take_along_axis(top, order, axis=0), np.take_along_axis(values, order, axis=0)
+
+
+def masks_from_logits(logits, classes=None):
+    """Бинарные маски выбранных классов по argmax логитов [classes, H, W]."""
+    classes = DEFAULT_MASK_CLASSES if classes is None else classes
+    labels = logits.argmax(axis=0)
+    return {name: labels == index for name, index in classes.items()}
+
+
+class MaskStore:
+    """Хранилище масок и top-k логитов с произвольным доступом по идентификатору кадра.
+
+    Args:
+        path (str): Директория хранилища.
+        mode (str): 'r' - только чтение, 'a' - дополнение (создается, если нет).
+        height (int | None): Высота выхода модели (обязательна при создании).
+        width (int | None): Ширина выхода модели (обязательна при создании).
+        topk (int | None): Сколько классов хранить на пиксель (по умолчанию 3).
+        num_classes (int | None): Число классов модели (по умолчанию ADE20K).
+        chunk_frames (int): На сколько кадров расширять файлы логитов за раз.
+
+    Для существующего хранилища заданные height, width, topk и num_classes
+    должны совпадать с сохраненными, иначе ValueError.
+    """
+
+    def __init__(self, path, mode='r', height=None, width=None, topk=None,
+                 num_classes=None, chunk_frames=256):
+        if mode not in ('r', 'a'):
+            raise ValueError(f"Неизвестный режим '{mode}', доступны 'r' и 'a'")
+        self.path = path
+        self.mode = mode
+        index_path = os.path.join(path, INDEX_NAME)
+        if os.path.exists(index_path):
+            with open(index_path, encoding='utf-8') as f:
+                self.index = json.load(f)
+            for key, value in (('height', height), ('width', width), ('topk', topk), ('num_classes', num_classes)):
+                if value is not None and value != self.index[key]:
+                    raise ValueError(f"Хранилище {path} создано с {key}={self.index[key]}, указано {value}")
+            # Хранилища без счетчика занятых слотов (записаны до его появления)
+            self.index.setdefault('used', sum(1 for entry in self.index['frames'].values()
+                                              if entry.get('slot') is not None))
+        elif mode == 'r':
+            raise FileNotFoundError(f"Хранилище не найдено: {path}")
+        else:
+            if height is None or width is None:
+                raise ValueError("Для нового хранилища нужны height и width выхода модели")
+            os.makedirs(path, exist_ok=True)
+            topk = 3 if topk is None else topk
+            num_classes = len(ADE20K_CLASSES) if num_classes is None else num_classes
+            self.index = {
+                'version': FORMAT_VERSION,
+                'height': height,
+                'width': width,
+                'topk': topk,
+                'num_classes': num_classes,
+                'index_dtype': 'uint8' if num_classes <= 256 else 'uint16',
+                'capacity': 0,
+                'used': 0,
+                'chunk_frames': chunk_frames,
+                'frames': {},
+            }
+        self._values = None
+        self._indices = None
+        self._open_arrays()
+
+    # --- Служебное ---
+
+    @property
+    def frame_shape(self):
+        return self.index['topk'], self.index['height'], self.index['width']
+
+    def _open_arrays(self):
+        capacity = self.index['capacity']
+        if capacity == 0:
+            self._values = self._indices = None
+            return
+        memmap_mode = 'r' if self.mode == 'r' else 'r+'
+        shape = (capacity,) + self.frame_shape
+        self._values = np.memmap(os.path.join(self.path, VALUES_NAME), dtype=np.float16,
+                                 mode=memmap_mode, shape=shape)
+        self._indices = np.memmap(os.path.join(self.path, INDICES_NAME), dtype=self.index['index_dtype'],
+                                  mode=memmap_mode, shape=shape)
+
+    def _resize(self, capacity):
+        """Меняет размер файлов логитов до capacity кадров и переоткрывает memmap."""
+        for array in (self._values, self._indices):
+            if array is not None:
+                array.flush()
+        self._values = self._indices = None
+        frame_elements = int(np.prod(self.frame_shape))
+        for name, itemsize in ((VALUES_NAME, 2), (INDICES_NAME, np.dtype(self.index['index_dtype']).itemsize)):
+            with open(os.path.join(self.path, name), 'ab') as f:
+                f.truncate(capacity * frame_elements * itemsize)
+        self.index['capacity'] = capacity
+        self._open_arrays()
+
+    # --- Запись ---
+
+    def add(self, frame_id, logits=None, masks=None):
+        """Добавляет или перезаписывает кадр.
+
+        Args:
+            frame_id (str): Идентификатор кадра.
+            logits (np.ndarray | None): Логиты [classes, H, W] или [1, classes, H, W].
+            masks (dict[str, np.ndarray] | None): Бинарные маски [H, W]. Если не заданы,
+                а логиты есть, строятся маски DEFAULT_MASK_CLASSES.
+        """
+        if self.mode == 'r':
+            raise IOError("Хранилище открыто только для чтения")
+        frame_id = str(frame_id)
+        entry = self.index['frames'].get(frame_id, {})
+
+        if logits is not None:
+            logits = np.asarray(logits)
+            if logits.ndim == 4:
+                logits = logits[0]
+            if logits.shape[1:] != (self.index['height'], self.index['width']):
+                raise ValueError(f"Форма логитов {logits.shape} не совпадает с хранилищем "
+                                 f"{self.index['height']}x{self.index['width']}")
+            if masks is None:
+                masks = masks_from_logits(logits)
+            indices, values = topk_logits(logits, self.index['topk'])
+            slot = entry.get('slot')
+            if slot is None:
+                slot = self.index['used']
+                if slot >= self.index['capacity']:
+                    # Расширяем блоками, чтобы не переотображать файлы на каждый кадр
+                    self._resize(self.index['capacity'] + self.index['chunk_frames'])
+                self.index['used'] += 1
+            self._indices[slot] = indices
+            self._values[slot] = values.astype(np.float16)
+            entry['slot'] = slot
+
+        if masks:
+            stored = entry.setdefault('masks', {})
+            with open(os.path.join(self.path, MASKS_NAME), 'ab') as f:
+                for name, mask in masks.items():
+                    codec, data = encode_mask(mask)
+                    stored[name] = [f.tell(), len(data), codec]
+                    f.write(data)
+
+        self.index['frames'][frame_id] = entry
+
+    def flush(self):
+        """Сбрасывает отображенные файлы и индекс на диск."""
+        if self.mode == 'r':
+            return
+        for array in (self._values, self._indices):
+            if array is not None:
+                array.flush()
+        tmp_path = os.path.join(self.path, INDEX_NAME + '.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.index, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.path, INDEX_NAME))
+
+    def close(self):
+        """Обрезает неиспользованный хвост блока и сохраняет индекс."""
+        if self.mode != 'r' and self.index['capacity'] > self.index['used']:
+            self._resize(self.index['used'])
+        self.flush()
+        self._values = self._indices = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Чтение ---
+
+    def __len__(self):
+        return len(self.index['frames'])
+
+    def __contains__(self, frame_id):
+        return str(frame_id) in self.index['frames']
+
+    def frame_ids(self):
+        return list(self.index['frames'])
+
+    def get_topk(self, frame_id):
+        """Индексы классов и значения top-k [k, H, W] - представления memmap без копирования."""
+        slot = self.index['frames'][str(frame_id)].get('slot')
+        if slot is None:
+            raise KeyError(f"Для кадра '{frame_id}' логиты не сохранены")
+        return self._indices[slot], self._values[slot]
+
+    def get_labels(self, frame_id):
+        """Карта классов (argmax) кадра [H, W]."""
+        return self.get_topk(frame_id)[0][0]
+
+    def get_mask(self, frame_id, name):
+        """Бинарная маска кадра [H, W]."""
+        offset, length, codec = self.index['frames'][str(frame_id)]['masks'][name]
+        with open(os.path.join(self.path, MASKS_NAME), 'rb') as f:
+            f.seek(offset)
+            data = f.read(length)
+        return decode_mask(codec, data, (self.index['height'], self.index['width']))
+
+    def get_dense_logits(self, frame_id, fill=None):
+        """Логиты [classes, H, W] float32: top-k значения, остальные классы - fill.
+
+        По умолчанию fill - минимум сохраненных значений кадра, поэтому argmax
+        совпадает с исходным. Вероятности softmax не восстанавливаются:
+        заполненные классы получают массу, которой у исходных не было, а масса
+        отброшенных классов теряется.
+        """
+        indices, values = self.get_topk(frame_id)
+        values = values.astype(np.float32)
+        fill = float(values.min()) if fill is None else fill
+        dense = np.full((self.index['num_classes'],) + values.shape[1:], fill, dtype=np.float32)
+        np.put_along_axis(dense, indices.astype(np.int64), values, axis=0)
+        return dense
+
+    def disk_usage(self):
+        """Размер файлов хранилища в байтах."""
+        return sum(os.path.getsize(os.path.join(self.path, name))
+                   for name in (INDEX_NAME, VALUES_NAME, INDICES_NAME, MASKS_NAME)
+                   if os.path.exists(os.path.join(self.path, name)))
+
+
+def compare_with_store(store, frame_id, logits, masks=None):
+    """Сравнивает новый выход модели с эталоном из хранилища.
+
+    Returns:
+        dict: Доля совпадения argmax, IoU по каждой маске и max|Δ| top-1 логита.
+    """
+    logits = np.asarray(logits)
+    if logits.ndim == 4:
+        logits = logits[0]
+    result = {}
+    entry = store.index['frames'][str(frame_id)]
+    if entry.get('slot') is not None:
+        indices, values = store.get_topk(frame_id)
+        labels = logits.argmax(axis=0)
+        result['argmax_agreement'] = float((labels == indices[0]).mean())
+        top1 = np.take_along_axis(logits, indices[:1].astype(np.int64), axis=0)[0]
+        result['top1_max_abs'] = float(np.abs(top1 - values[0].astype(np.float32)).max())
+    masks = masks_from_logits(logits) if masks is None else masks
+    for name in entry.get('masks', {}):
+        if name not in masks:
+            continue
+        reference = store.get_mask(frame_id, name)
+        union = np.logical_or(reference, masks[name]).sum()
+        intersection = np.logical_and(reference, masks[name]).sum()
+        result[f'iou_{name}'] = float(intersection / union) if union else 1.0
+    return result
+
+
+def run_golden(model_path, store_path, frames, check=False, topk=3, min_agreement=0.99):
+    """Записывает эталонные выходы модели в хранилище или сверяется с ними.
+
+    Args:
+        model_path (str): Путь к модели ONNX.
+        store_path (str): Директория хранилища.
+        frames (iterable): Пары (идентификатор кадра, входной тензор NCHW float32).
+        check (bool): Сверить с уже записанными эталонами вместо записи.
+        topk (int): Сколько классов хранить на пиксель при записи.
+        min_agreement (float): Минимальная доля совпадения argmax при проверке.
+
+    Returns:
+        bool: True, если запись прошла или все кадры совпали с эталоном.
+    """
+    from inspect_onnx_model import create_session
+
+    session = create_session(model_path)
+    input_name = session.get_inputs()[0].name
+    store = None
+    ok = True
+    try:
+        for frame_id, input_tensor in frames:
+            logits = session.run(None, {input_name: input_tensor})[0]
+            if store is None:
+                if check:
+                    store = MaskStore(store_path, 'r')
+                else:
+                    try:
+                        store = MaskStore(store_path, 'a', height=logits.shape[-2], width=logits.shape[-1],
+                                          topk=topk, num_classes=logits.shape[-3])
+                    except ValueError as e:
+                        print(f"Ошибка: {e}")
+                        return False
+            if not check:
+                store.add(frame_id, logits)
+                continue
+            if frame_id not in store:
+                print(f"  {frame_id}: нет в эталоне")
+                ok = False
+                continue
+            result = compare_with_store(store, frame_id, logits)
+            passed = result.get('argmax_agreement', 1.0) >= min_agreement
+            ok = ok and passed
+            details = ', '.join(f"{key}={value:.4f}" for key, value in result.items())
+            print(f"  {'✅' if passed else '❌'} {frame_id}: {details}")
+    finally:
+        if store is not None:
+            store.close()
+
+    if store is None:
+        print("Нет кадров для обработки")
+        return False
+    if not check:
+        print(f"Записано кадров: {len(store)} в {store_path} "
+              f"({store.disk_usage() / (1024 * 1024):.2f} МБ)")
+    return ok
+
+
+def print_store_info(store_path):
+    """Печатает параметры хранилища и статистику кодирования масок."""
+    store = MaskStore(store_path, 'r')
+    index = store.index
+    print(f"Хранилище: {store_path}")
+    print(f"  Кадров: {len(store)}, выход {index['height']}x{index['width']}, "
+          f"классов {index['num_classes']}, top-{index['topk']}")
+    print(f"  Ёмкость файлов логитов: {index['capacity']} кадров (блок {index['chunk_frames']})")
+    print(f"  Размер на диске: {store.disk_usage() / (1024 * 1024):.2f} МБ")
+    codecs = {}
+    for entry in index['frames'].values():
+        for _, length, codec in entry.get('masks', {}).values():
+            count, total = codecs.get(codec, (0, 0))
+            codecs[codec] = (count + 1, total + length)
+    raw_bytes = index['height'] * index['width']
+    for codec, (count, total) in sorted(codecs.items()):
+        print(f"  Маски {codec}: {count} шт., в среднем {total / count:.0f} байт "
+              f"(против {raw_bytes} байт без сжатия)")
+    return True
@@ -1,14 +1,185 @@
-from optimum.exporters.onnx import main_export
+import argparse
+import hashlib
+import inspect
+import json
+import os
+import time
 from pathlib import Path
 
+INPUT_NAME = "pixel_values"
+OUTPUT_NAME = "logits"
+MANIFEST_NAME = "export_manifest.json"
+
+
+def file_sha256(path):
+    """SHA-256 файла, читаемого блоками (модели могут весить сотни МБ)."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def checkpoint_sha256(checkpoint_dir):
+    """Хеш содержимого чекпоинта: конфиг и веса в детерминированном порядке."""
+    digest = hashlib.sha256()
+    for path in sorted(Path(checkpoint_dir).rglob("*")):
+        if path.is_file():
+            digest.update(str(path.relative_to(checkpoint_dir)).encode("utf-8"))
+            digest.update(file_sha256(path).encode("ascii"))
+    return digest.hexdigest()
+
+
+def load_checkpoint(checkpoint_dir, task="semantic-segmentation"):
+    """Загружает модель PyTorch из локальной директории чекпоинта без обращения к сети."""
+    # До импорта transformers: huggingface_hub читает эти переменные при импорте
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    import torch
+    from transformers import AutoModelForSemanticSegmentation
+
+    if task != "semantic-segmentation":
+        raise ValueError(f"Поддерживается только задача 'semantic-segmentation', указана '{task}'")
+    if not os.path.isdir(checkpoint_dir):
+        raise FileNotFoundError(f"Директория чекпоинта не найдена: {checkpoint_dir}")
+
+    torch.manual_seed(0)
+    # Обычное внимание вместо scaled_dot_product_attention: SDPA экспортируется только с opset 14+
+    model = AutoModelForSemanticSegmentation.from_pretrained(
+        checkpoint_dir, local_files_only=True, attn_implementation="eager")
+    model.eval()
+    return model
+
+
+def _logits_only(model):
+    import torch
+
+    class LogitsOnly(torch.nn.Module):
+        """Оставляет единственный выход logits [batch, classes, h/4, w/4]."""
+
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, pixel_values):
+            return self.inner(pixel_values=pixel_values).logits
+
+    return LogitsOnly(model).eval()
+
+
+def export_static(model, output_path, height, width, opset, batch_size=1):
+    """Экспортирует уже загруженную модель с фиксированной формой входа.
+
+    Args:
+        model: Модель PyTorch (результат load_checkpoint).
+        output_path (str): Путь к .onnx файлу.
+        height (int): Высота входа.
+        width (int): Ширина входа.
+        opset (int): Версия opset.
+        batch_size (int): Размер батча.
+
+    Returns:
+        dict: Запись манифеста: параметры, время экспорта, размер и хеш модели.
+    """
+    import torch
+
+    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+    dummy = torch.zeros(batch_size, 3, height, width, dtype=torch.float32)
+
+    export_kwargs = {}
+    # В новых версиях torch экспортер по умолчанию dynamo; нам нужен классический TorchScript
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        export_kwargs["dynamo"] = False
+
+    start_time = time.perf_counter()
+    with torch.no_grad():
+        torch.onnx.export(
+            _logits_only(model),
+            (dummy,),
+            output_path,
+            input_names=[INPUT_NAME],
+            output_names=[OUTPUT_NAME],
+            opset_version=opset,
+            do_constant_folding=True,
+            # dynamic_axes не задаем: все размеры статические
+            **export_kwargs,
+        )
+    export_time = time.perf_counter() - start_time
+
+    return {
+        "path": str(output_path),
+        "batch_size": batch_size,
+        "height": height,
+        "width": width,
+        "opset": opset,
+        "export_time_s": round(export_time, 3),
+        "size_bytes": os.path.getsize(output_path),
+        "sha256": file_sha256(output_path),
+    }
+
+
+def export_variants(checkpoint_dir, output_dir, resolutions=((512, 512),), opsets=(13,), batch_size=1,
+                    telemetry=None):
+    """Экспортирует чекпоинт для всех пар (разрешение, opset), загружая модель один раз.
+
+    Файлы называются model_<h>x<w>_opset<N>.onnx, рядом пишется export_manifest.json
+    с хешем чекпоинта, временем экспорта и хешем каждой модели.
+
+    Returns:
+        dict: Манифест экспорта.
+    """
+    print(f"Загружаю чекпоинт из {checkpoint_dir} (офлайн)...")
+    load_start = time.perf_counter()
+    model = load_checkpoint(checkpoint_dir)
+    load_time = time.perf_counter() - load_start
+    print(f"Модель загружена за {load_time:.2f} с")
+    if telemetry is not None:
+        telemetry.lap('load')
+
+    manifest = {
+        "checkpoint": os.path.abspath(checkpoint_dir),
+        "checkpoint_sha256": checkpoint_sha256(checkpoint_dir),
+        "load_time_s": round(load_time, 3),
+        "exports": [],
+    }
+    preprocessor_config = Path(checkpoint_dir) / "preprocessor_config.json"
+    if preprocessor_config.exists():
+        # Нормализация входа понадобится при подготовке входных данных
+        config = json.loads(preprocessor_config.read_text(encoding="utf-8"))
+        manifest["image_mean"] = config.get("image_mean")
+        manifest["image_std"] = config.get("image_std")
+
+    for height, width in resolutions:
+        for opset in opsets:
+            output_path = Path(output_dir) / f"model_{height}x{width}_opset{opset}.onnx"
+            print(f"Экспорт {height}x{width}, opset {opset} -> {output_path}")
+            entry = export_static(model, output_path, height, width, opset, batch_size)
+            print(f"  {entry['export_time_s']:.2f} с, {entry['size_bytes'] / (1024 * 1024):.1f} МБ, "
+                  f"sha256 {entry['sha256'][:12]}")
+            manifest["exports"].append(entry)
+
+    manifest_path = Path(output_dir) / MANIFEST_NAME
+    manifest_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Манифест экспорта сохранен в {manifest_path}")
+    if telemetry is not None:
+        telemetry.lap('transform')
+        telemetry.record(checkpoint_sha256=manifest["checkpoint_sha256"], exports=manifest["exports"])
+    return manifest
+
+
 def convert_model_to_onnx(model_id, output_path):
     """
     Конвертирует модель из Hugging Face Hub в ONNX формат.
 
+    Требует сети; для воспроизводимого офлайн экспорта из локального
+    чекпоинта используйте export_variants.
+
     Args:
         model_id (str): Идентификатор модели на Hugging Face (например, 'leftattention/segformer-b4-wall').
         output_path (str): Путь для сохранения сконвертированной ONNX модели (включая имя файла .onnx).
     """
+    from optimum.exporters.onnx import main_export
+
     print(f"Начало конвертации модели: {model_id}")
     print(f"Выходной путь для ONNX модели: {output_path}")
 
@@ -53,11 +224,22 @@ def convert_model_to_onnx(model_id, output_path):
         print("- Для моделей с динамическими размерами входа/выхода могут потребоваться дополнительные флаги.")
         print("---------------------------------------------------------------------")
 
+
 if __name__ == "__main__":
-    MODEL_ID = "leftattention/segformer-b4-wall"
-    ONNX_OUTPUT_PATH = "onnx_models/segformer-b4-wall/model.onnx" # Сохраняем в подпапку
+    import sys
+
+    # Общие модули пайплайна лежат в корне репозитория
+    sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+    from resolutions import parse_resolution
 
-    # Создаем директорию для ONNX моделей, если ее нет
-    Path("onnx_models/segformer-b4-wall").mkdir(parents=True, exist_ok=True)
+    parser = argparse.ArgumentParser(description="Офлайн экспорт SegFormer из локального чекпоинта в ONNX")
+    parser.add_argument("checkpoint", help="директория с config.json и весами модели")
+    parser.add_argument("--output-dir", default="onnx_models/segformer-b4-wall")
+    parser.add_argument("--resolutions", nargs="+", default=["512"], help="например 320 512 512x384")
+    parser.add_argument("--opsets", type=int, nargs="+", default=[13])
+    parser.add_argument("--batch-size", type=int, default=1)
+    args = parser.parse_args()
 
-    convert_model_to_onnx(MODEL_ID, ONNX_OUTPUT_PATH) 
\ No newline at end of file
+    export_variants(args.checkpoint, args.output_dir,
+                    resolutions=[parse_resolution(r) for r in args.resolutions],
+                    opsets=args.opsets, batch_size=args.batch_size)
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Единая точка входа для инструментов подготовки модели к Unity Sentis.
+
+Каждая подкоманда импортирует свой модуль (и его тяжёлые зависимости:
+onnx, onnxsim, onnxruntime, matplotlib) только при вызове, поэтому
+`--help` и справочные команды запускаются мгновенно.
+
+Примеры:
+    python3 model_tools.py simplify model.onnx model_simplified.onnx
+    python3 model_tools.py analyze model_simplified.onnx
+    python3 model_tools.py inspect model_unity_final.onnx --info-only
+    python3 model_tools.py shapes model_unity_final.onnx model_with_shapes.onnx --compare
+    python3 model_tools.py postprocess model_unity_final.onnx model_unity_mask.onnx --classes 0 --blur 4
+    python3 model_tools.py --time bench model_unity_final.onnx --runs 50
+    python3 model_tools.py scaling model_unity_final.onnx --cores 1 4 8 --batch-sizes 1 4
+    python3 model_tools.py report --fail-on-regression
+    python3 model_tools.py matrix model.onnx --opsets 13 15 --resolutions 320 512 --precisions fp32 fp16
+    python3 model_tools.py corpus room_photos corpus --resolutions 320 512 --dtype float16
+    python3 model_tools.py bench model_unity_final.onnx --corpus corpus
+    python3 model_tools.py golden model_unity_final.onnx golden_masks --corpus corpus --check
+    python3 model_tools.py logs Player.log --timeline frames.csv
+
+Этапы конвейера и bench дописывают метрики в журнал запусков
+(`--run-log`, по умолчанию model_pipeline_runs.jsonl), см. pipeline_telemetry.py.
+"""
+import argparse
+import os
+import sys
+import time
+
+import pipeline_telemetry
+
+_START_TIME = time.perf_counter()
+
+STREAMING_ASSETS = os.path.join('Assets', 'StreamingAssets')
+
+
+def _asset(name):
+    return os.path.join(STREAMING_ASSETS, name)
+
+
+def _cmd_simplify(args, telemetry):
+    from simplify_model import simplify_model
+    return simplify_model(args.input, args.output, telemetry)
+
+
+def _cmd_analyze(args, telemetry):
+    from analyze_model_compatibility import analyze_model
+    unsupported_ops = analyze_model(args.model, telemetry)
+    if unsupported_ops is None:
+        return False
+    return not (args.strict and unsupported_ops)
+
+
+def _cmd_convert(args, telemetry):
+    from convert_to_sentis_format import convert_to_sentis_format
+    return convert_to_sentis_format(args.input, args.output, telemetry)
+
+
+def _cmd_fix(args, telemetry):
+    from fix_unsqueeze_operators import fix_unsqueeze_operators
+    return fix_unsqueeze_operators(args.input, args.output, telemetry)
+
+
+def _cmd_sort(args, telemetry):
+    from fix_topological_order import fix_topological_order
+    return fix_topological_order(args.input, args.output, telemetry)
+
+
+def _cmd_finalize(args, telemetry):
+    from final_preparation import final_preparation
+    return final_preparation(args.input, args.output, args.copy_to, telemetry)
+
+
+def _cmd_postprocess(args, telemetry):
+    from postprocess_mask import add_mask_postprocessing
+    from resolutions import parse_resolution
+    return add_mask_postprocessing(
+        args.input, args.output, telemetry, classes=args.classes, activation=args.activation,
+        mask_size=parse_resolution(args.mask_size) if args.mask_size else None,
+        blur_size=args.blur, sigma=args.sigma,
+        threshold=None if args.no_threshold else args.threshold, keep_logits=args.keep_logits)
+
+
+def _cmd_inspect(args, telemetry):
+    from inspect_onnx_model import main as inspect_main
+    return inspect_main(args.model, run_inference=not args.info_only)
+
+
+def _cmd_bench(args, telemetry):
+    from inspect_onnx_model import benchmark_model
+    stats = benchmark_model(args.model, height=args.height, width=args.width,
+                            warmup=args.warmup, runs=args.runs, intra_op_threads=args.threads,
+                            telemetry=telemetry, corpus=args.corpus)
+    return stats is not None
+
+
+def _cmd_classes(args, telemetry):
+    from model_classes import main as classes_main
+    classes_main()
+    return True
+
+
+def _cmd_report(args, telemetry):
+    from pipeline_telemetry import print_report
+    regressions = print_report(args.run_log, stage=args.stage, last=args.last,
+                               size_threshold=args.size_threshold,
+                               latency_threshold=args.latency_threshold)
+    return not (args.fail_on_regression and regressions)
+
+
+def _cmd_reference(args, telemetry):
+    from sentis_reference_executor import run_reference
+    return run_reference(args.model, height=args.height, width=args.width,
+                         compare=args.compare, top=args.top, batch_size=args.batch_size,
+                         corpus=args.corpus)
+
+
+def _cmd_export(args, telemetry):
+    from model_conversion_env.convert_to_onnx import export_variants
+    from resolutions import parse_resolution
+    export_variants(args.checkpoint, args.output_dir,
+                    resolutions=[parse_resolution(r) for r in args.resolutions],
+                    opsets=args.opsets, batch_size=args.batch_size, telemetry=telemetry)
+    return True
+
+
+def _cmd_matrix(args, telemetry):
+    from build_matrix import load_spec, run_matrix
+    spec = load_spec(args.spec, args.opsets, args.resolutions, args.precisions)
+    results = run_matrix(args.models, spec, out_dir=args.out_dir, max_workers=args.workers,
+                         memory_budget_mb=args.memory_budget_mb, bench=not args.no_bench,
+                         runs=args.runs, run_id=args.run_id, run_log=args.run_log)
+    return all(result['ok'] for result in results)
+
+
+def _cmd_golden(args, telemetry):
+    from mask_store import run_golden
+    if args.corpus:
+        from input_corpus import InputCorpus
+        frames = InputCorpus(args.corpus).frames(args.height, args.width)
+    else:
+        from inspect_onnx_model import make_input_tensor, make_test_image
+        frames = [(f"gradient_{args.height}x{args.width}",
+                   make_input_tensor(make_test_image(args.height, args.width)))]
+    return run_golden(args.model, args.store, frames, check=args.check, topk=args.topk)
+
+
+def _cmd_corpus(args, telemetry):
+    from input_corpus import build_corpus
+    from resolutions import parse_resolution
+    manifest = build_corpus(args.images, args.output, [parse_resolution(r) for r in args.resolutions],
+                            dtype=args.dtype, export_manifest=args.export_manifest, telemetry=telemetry)
+    return manifest is not None
+
+
+def _cmd_scaling(args, telemetry):
+    from scaling_benchmark import run_scaling
+    best = run_scaling(args.model, core_counts=args.cores, threads=args.threads, sessions=args.sessions,
+                       processes=args.processes, batch_sizes=args.batch_sizes, height=args.height,
+                       width=args.width, corpus=args.corpus, warmup=args.warmup, requests=args.requests,
+                       output_path=args.output)
+    return bool(best)
+
+
+def _cmd_masks(args, telemetry):
+    from mask_store import print_store_info
+    return print_store_info(args.store)
+
+
+def _cmd_shapes(args, telemetry):
+    from shape_inference_cache import infer_model_shapes
+    return infer_model_shapes(args.input, args.output, telemetry, compare=args.compare)
+
+
+def _cmd_logs(args, telemetry):
+    from unity_log_analyzer import analyze_logs
+    analyze_logs(args.logs, timeline_path=args.timeline, run_log=args.run_log)
+    return True
+
+
+def _add_io_arguments(parser, default_input, default_output):
+    parser.add_argument('input', nargs='?', default=default_input,
+                        help=f"входная модель (по умолчанию {default_input})")
+    parser.add_argument('output', nargs='?', default=default_output,
+                        help=f"выходная модель (по умолчанию {default_output})")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='model_tools.py',
+        description="Инструменты подготовки ONNX модели для Unity Sentis 2.1.x")
+    parser.add_argument('--time', action='store_true',
+                        help="вывести время импорта и выполнения команды")
+    parser.add_argument('--run-log', default=pipeline_telemetry.DEFAULT_RUN_LOG,
+                        help="журнал запусков JSONL (по умолчанию %(default)s)")
+    parser.add_argument('--run-id', default=None,
+                        help="идентификатор запуска, общий для этапов (или SENTIS_RUN_ID)")
+    parser.add_argument('--no-telemetry', action='store_true',
+                        help="не записывать метрики этапа в журнал")
+    subparsers = parser.add_subparsers(dest='command', metavar='<команда>')
+    subparsers.required = True
+
+    p = subparsers.add_parser('simplify', help="упрощение модели через onnxsim")
+    _add_io_arguments(p, _asset('model.onnx'), _asset('model_simplified.onnx'))
+    p.set_defaults(handler=_cmd_simplify, tracked=True)
+
+    p = subparsers.add_parser('analyze', help="проверка поддержки операторов Sentis")
+    p.add_argument('model', nargs='?', default=_asset('model_simplified.onnx'))
+    p.add_argument('--strict', action='store_true',
+                   help="вернуть ненулевой код, если есть неподдерживаемые операторы")
+    p.set_defaults(handler=_cmd_analyze, tracked=True)
+
+    p = subparsers.add_parser('convert', help="приведение метаданных, IR и opset к Sentis")
+    _add_io_arguments(p, _asset('model_simplified.onnx'), _asset('model_sentis_compatible.onnx'))
+    p.set_defaults(handler=_cmd_convert, tracked=True)
+
+    p = subparsers.add_parser('fix', help="исправление операторов Unsqueeze для opset 13+")
+    _add_io_arguments(p, _asset('model_sentis_compatible.onnx'), _asset('model_final.onnx'))
+    p.set_defaults(handler=_cmd_fix, tracked=True)
+
+    p = subparsers.add_parser('sort', help="восстановление топологического порядка узлов")
+    _add_io_arguments(p, _asset('model_final.onnx'), _asset('model_unity_ready.onnx'))
+    p.set_defaults(handler=_cmd_sort, tracked=True)
+
+    p = subparsers.add_parser('finalize', help="финальная подготовка модели для Unity")
+    _add_io_arguments(p, _asset('model_unity_ready.onnx'), _asset('model_unity_final.onnx'))
+    p.add_argument('--copy-to', default=_asset('model.onnx'),
+                   help="куда дополнительно скопировать результат для Unity "
+                        "(по умолчанию model.onnx; пустая строка - не копировать)")
+    p.set_defaults(handler=_cmd_finalize, tracked=True)
+
+    p = subparsers.add_parser('postprocess', help="маска в графе: выбор классов, активация, Resize, размытие, порог")
+    _add_io_arguments(p, _asset('model_unity_final.onnx'), _asset('model_unity_mask.onnx'))
+    p.add_argument('--classes', type=int, nargs='+', default=[0], help="индексы классов маски (0 - wall в ADE20K)")
+    p.add_argument('--activation', choices=['sigmoid', 'softmax'], default='sigmoid')
+    p.add_argument('--mask-size', default=None, help="разрешение маски, например 512 или 512x384 (по умолчанию - как вход)")
+    p.add_argument('--blur', type=int, default=4, help="радиус размытия по Гауссу, 0 - без размытия (maskBlurSize)")
+    p.add_argument('--sigma', type=float, default=None, help="сигма размытия (по умолчанию радиус / 2)")
+    p.add_argument('--threshold', type=float, default=0.15, help="порог уверенности (segmentationConfidenceThreshold)")
+    p.add_argument('--no-threshold', action='store_true', help="выдавать вероятность вместо бинарной маски")
+    p.add_argument('--keep-logits', action='store_true', help="оставить выход логитов")
+    p.set_defaults(handler=_cmd_postprocess, tracked=True)
+
+    p = subparsers.add_parser('shapes', help="инкрементальный вывод форм, проверка узлов и запись value_info")
+    p.add_argument('input', nargs='?', default=_asset('model_unity_final.onnx'),
+                   help="модель (по умолчанию %(default)s)")
+    p.add_argument('output', nargs='?', default=None, help="сохранить модель с value_info")
+    p.add_argument('--compare', action='store_true', help="сравнить с onnx.shape_inference.infer_shapes")
+    p.set_defaults(handler=_cmd_shapes, tracked=True)
+
+    p = subparsers.add_parser('inspect', help="метаданные, входы/выходы и тестовый инференс")
+    p.add_argument('model', nargs='?', default=os.path.join('Assets', 'Models', 'model_unity_final.onnx'))
+    p.add_argument('--info-only', action='store_true',
+                   help="только метаданные, без инференса и визуализации")
+    p.set_defaults(handler=_cmd_inspect)
+
+    p = subparsers.add_parser('bench', help="замер времени инференса onnxruntime")
+    p.add_argument('model', nargs='?', default=os.path.join('Assets', 'Models', 'model_unity_final.onnx'))
+    p.add_argument('--height', type=int, default=320)
+    p.add_argument('--width', type=int, default=320)
+    p.add_argument('--warmup', type=int, default=3)
+    p.add_argument('--runs', type=int, default=20)
+    p.add_argument('--threads', type=int, default=None, help="intra_op_num_threads")
+    p.add_argument('--corpus', default=None, help="директория корпуса входов вместо тестового градиента")
+    p.set_defaults(handler=_cmd_bench, tracked=True)
+
+    p = subparsers.add_parser('scaling', help="масштабирование по ядрам: потоки × сессии × процессы × батч")
+    p.add_argument('model', nargs='?', default=os.path.join('Assets', 'Models', 'model_unity_final.onnx'))
+    p.add_argument('--cores', type=int, nargs='+', default=None,
+                   help="числа ядер (по умолчанию 1, 2, 4, ... до числа ядер машины)")
+    p.add_argument('--threads', type=int, nargs='+', default=None, help="intra-op потоков на сессию")
+    p.add_argument('--sessions', type=int, nargs='+', default=None, help="сессий в процессе")
+    p.add_argument('--processes', type=int, nargs='+', default=None, help="процессов")
+    p.add_argument('--batch-sizes', type=int, nargs='+', default=[1])
+    p.add_argument('--height', type=int, default=320)
+    p.add_argument('--width', type=int, default=320)
+    p.add_argument('--corpus', default=None, help="директория корпуса входов вместо тестового градиента")
+    p.add_argument('--warmup', type=int, default=2)
+    p.add_argument('--requests', type=int, default=20, help="замеряемых запросов на сессию")
+    p.add_argument('--output', default=None, help="сохранить результаты в JSON")
+    p.set_defaults(handler=_cmd_scaling)
+
+    p = subparsers.add_parser('classes', help="список классов ADE20K")
+    p.set_defaults(handler=_cmd_classes)
+
+    p = subparsers.add_parser('reference', help="выполнение на NumPy с ограничениями Sentis и профилем операторов")
+    p.add_argument('model', nargs='?', default=_asset('model_unity_final.onnx'))
+    p.add_argument('--height', type=int, default=None, help="для динамического входа")
+    p.add_argument('--width', type=int, default=None, help="для динамического входа")
+    p.add_argument('--compare', action='store_true', help="сверить выход с onnxruntime")
+    p.add_argument('--top', type=int, default=10, help="сколько самых дорогих узлов выводить")
+    p.add_argument('--batch-size', type=int, default=None,
+                   help="для динамического батча (по умолчанию - кадров корпуса или 1)")
+    p.add_argument('--corpus', default=None, help="директория корпуса входов вместо тестового градиента")
+    p.set_defaults(handler=_cmd_reference)
+
+    p = subparsers.add_parser('export', help="офлайн экспорт локального чекпоинта в ONNX со статическими формами")
+    p.add_argument('checkpoint', help="директория с config.json и весами модели")
+    p.add_argument('--output-dir', default=os.path.join('model_conversion_env', 'onnx_models', 'segformer-b4-wall'))
+    p.add_argument('--resolutions', nargs='+', default=['512'], help="например 320 512 512x384")
+    p.add_argument('--opsets', type=int, nargs='+', default=[13])
+    p.add_argument('--batch-size', type=int, default=1)
+    p.set_defaults(handler=_cmd_export, tracked=True)
+
+    p = subparsers.add_parser('matrix', help="параллельная сборка моделей × вариантов")
+    p.add_argument('models', nargs='+', help="ONNX файлы или локальные директории чекпоинтов")
+    p.add_argument('--spec', default=None, help="JSON со списками opsets, resolutions, precisions")
+    p.add_argument('--opsets', type=int, nargs='+', default=None)
+    p.add_argument('--resolutions', nargs='+', default=None, help="например 320 512x384")
+    p.add_argument('--precisions', nargs='+', default=None, help="fp32, fp16")
+    p.add_argument('--out-dir', default='build_matrix')
+    p.add_argument('--workers', type=int, default=None, help="число процессов (по умолчанию - ядра)")
+    p.add_argument('--memory-budget-mb', type=int, default=4096,
+                   help="суммарный бюджет памяти параллельных задач (по умолчанию %(default)s)")
+    p.add_argument('--runs', type=int, default=10, help="запусков при замере задержки")
+    p.add_argument('--no-bench', action='store_true', help="не замерять задержку")
+    p.set_defaults(handler=_cmd_matrix)
+
+    p = subparsers.add_parser('golden', help="запись эталонных масок и top-k логитов или сверка с ними")
+    p.add_argument('model')
+    p.add_argument('store', help="директория хранилища масок")
+    p.add_argument('--check', action='store_true', help="сверить с эталоном вместо записи")
+    p.add_argument('--height', type=int, default=320)
+    p.add_argument('--width', type=int, default=320)
+    p.add_argument('--topk', type=int, default=3, help="сколько классов хранить на пиксель")
+    p.add_argument('--corpus', default=None, help="директория корпуса входов вместо тестового градиента")
+    p.set_defaults(handler=_cmd_golden)
+
+    p = subparsers.add_parser('corpus', help="однократная предобработка фотографий в корпус входов (memmap)")
+    p.add_argument('images', help="директория с фотографиями")
+    p.add_argument('output', help="директория корпуса")
+    p.add_argument('--resolutions', nargs='+', default=['512'], help="например 320 512 512x384")
+    p.add_argument('--dtype', choices=['float32', 'float16'], default='float32')
+    p.add_argument('--export-manifest', default=None,
+                   help="взять mean/std из export_manifest.json вместо ImageNet")
+    p.set_defaults(handler=_cmd_corpus, tracked=True)
+
+    p = subparsers.add_parser('masks', help="сводка по хранилищу масок")
+    p.add_argument('store')
+    p.set_defaults(handler=_cmd_masks)
+
+    p = subparsers.add_parser('logs', help="задержки, разрешения, формы тензоров и ошибки из журналов Unity")
+    p.add_argument('logs', nargs='*', default=['build.log', 'compile.log', 'mono_crash.*.json'],
+                   help="журналы player/editor/logcat, MSBuild и mono_crash JSON (по умолчанию %(default)s)")
+    p.add_argument('--timeline', default=None, help="сохранить временную шкалу кадров в CSV")
+    p.set_defaults(handler=_cmd_logs)
+
+    p = subparsers.add_parser('report', help="тренды метрик и регрессии между запусками")
+    p.add_argument('--stage', default=None, help="показать только этот этап")
+    p.add_argument('--last', type=int, default=10, help="сколько последних запусков выводить")
+    p.add_argument('--size-threshold', type=float, default=pipeline_telemetry.SIZE_THRESHOLD,
+                   help="допустимый относительный рост размера (по умолчанию %(default)s)")
+    p.add_argument('--latency-threshold', type=float, default=pipeline_telemetry.LATENCY_THRESHOLD,
+                   help="допустимый относительный рост времени (по умолчанию %(default)s)")
+    p.add_argument('--fail-on-regression', action='store_true',
+                   help="вернуть ненулевой код при регрессии")
+    p.set_defaults(handler=_cmd_report)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    telemetry = None
+    if getattr(args, 'tracked', False) and not args.no_telemetry:
+        telemetry = pipeline_telemetry.StageTelemetry(
+            args.command,
+            input_path=(getattr(args, 'input', None) or getattr(args, 'model', None)
+                        or getattr(args, 'checkpoint', None) or getattr(args, 'images', None)),
+            output_path=getattr(args, 'output', None),
+            run_id=args.run_id,
+            log_path=args.run_log)
+
+    command_start = time.perf_counter()
+    ok = args.handler(args, telemetry)
+    finished = time.perf_counter()
+
+    if telemetry is not None:
+        telemetry.write(ok)
+
+    if args.time:
+        print(f"\n[{args.command}] запуск CLI: {command_start - _START_TIME:.3f} с, "
+              f"команда: {finished - command_start:.3f} с", file=sys.stderr)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
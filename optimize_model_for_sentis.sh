@@ -7,24 +7,30 @@
 echo "=== Проверка и установка зависимостей ==="
 python3 -m pip install onnx onnxsim networkx
 
+# Общий идентификатор запуска для журнала метрик этапов (model_pipeline_runs.jsonl)
+export SENTIS_RUN_ID="${SENTIS_RUN_ID:-$(date +%Y%m%d-%H%M%S)}"
+
 # Выполняем все этапы оптимизации последовательно
 echo -e "\n=== 1. Упрощение модели ==="
-python3 simplify_model.py
+python3 model_tools.py simplify
 
 echo -e "\n=== 2. Анализ совместимости ==="
-python3 analyze_model_compatibility.py
+python3 model_tools.py analyze
 
 echo -e "\n=== 3. Преобразование в совместимый формат ==="
-python3 convert_to_sentis_format.py
+python3 model_tools.py convert
 
 echo -e "\n=== 4. Исправление операторов Unsqueeze ==="
-python3 fix_unsqueeze_operators.py
+python3 model_tools.py fix
 
 echo -e "\n=== 5. Исправление топологического порядка ==="
-python3 fix_topological_order.py
+python3 model_tools.py sort
 
 echo -e "\n=== 6. Финальная подготовка ==="
-python3 final_preparation.py
+python3 model_tools.py finalize --copy-to Assets/StreamingAssets/model.onnx
+
+echo -e "\n=== Метрики и регрессии относительно прошлых запусков ==="
+python3 model_tools.py report --last 5
 
 echo -e "\n=== Оптимизация завершена! ==="
 echo "Модель готова к использованию в Unity Sentis. Не забудьте выполнить 'Serialize To StreamingAssets' в Unity." 
\ No newline at end of file
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Структурированная телеметрия этапов подготовки модели.
+
+Каждый этап (simplify, convert, fix, sort, finalize, ...) записывает одну
+JSON-строку в журнал запусков: время по фазам (load, transform, save,
+check), размер входа/выхода, число узлов, инициализаторов и операторов
+по типам, потребление памяти. Журнал только дополняется, поэтому
+по нему можно отслеживать тренды между обновлениями модели.
+
+Модуль использует только стандартную библиотеку, чтобы не замедлять запуск CLI.
+"""
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+DEFAULT_RUN_LOG = os.environ.get('SENTIS_RUN_LOG', 'model_pipeline_runs.jsonl')
+
+# Пороги регрессии по умолчанию (относительный рост между запусками)
+SIZE_THRESHOLD = 0.01
+LATENCY_THRESHOLD = 0.20
+
+
+def new_run_id():
+    """Идентификатор запуска: общий для всех этапов, если задан SENTIS_RUN_ID."""
+    return os.environ.get('SENTIS_RUN_ID') or datetime.now().strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+
+
+def _proc_status_bytes(field):
+    try:
+        with open('/proc/self/status', encoding='ascii') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def current_rss_bytes():
+    """Текущее потребление памяти процессом в байтах (None вне Linux)."""
+    return _proc_status_bytes('VmRSS')
+
+
+def peak_rss_bytes():
+    """Пиковое потребление памяти процессом за все время его жизни в байтах (None, если недоступно)."""
+    # VmHWM сбрасывается при exec, а ru_maxrss наследуется от родителя,
+    # поэтому для процессов пула на Linux точнее читать /proc
+    peak = _proc_status_bytes('VmHWM')
+    if peak is not None:
+        return peak
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux отдает килобайты, macOS - байты
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def model_stats(model):
+    """Число узлов, инициализаторов и операторов по типам для ModelProto."""
+    op_types = {}
+    for node in model.graph.node:
+        op_types[node.op_type] = op_types.get(node.op_type, 0) + 1
+    return {
+        'nodes': len(model.graph.node),
+        'initializers': len(model.graph.initializer),
+        'op_types': dict(sorted(op_types.items())),
+    }
+
+
+def _file_size(path):
+    if path and os.path.isfile(path):
+        return os.path.getsize(path)
+    return None
+
+
+class StageTelemetry:
+    """Собирает метрики одного этапа и дописывает их в журнал запусков.
+
+    Время фаз считается как интервал от предыдущей отметки `lap`, поэтому
+    этапу достаточно вызвать `lap('load')`, `lap('transform')` и т.д. по
+    мере выполнения, без перестройки своего кода.
+    """
+
+    def __init__(self, stage, input_path=None, output_path=None, run_id=None, log_path=DEFAULT_RUN_LOG):
+        self.stage = stage
+        self.input_path = input_path
+        self.output_path = output_path
+        self.run_id = run_id or new_run_id()
+        self.log_path = log_path
+        self.phases = {}
+        self.models = {}
+        self.extra = {}
+        self._started = time.perf_counter()
+        self._last = self._started
+        self._start_rss = current_rss_bytes()
+
+    def lap(self, phase):
+        """Закрывает фазу `phase`: время с предыдущей отметки прибавляется к ней."""
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + (now - self._last)
+        self._last = now
+
+    def record_model(self, role, model):
+        """Запоминает статистику модели в роли 'input' или 'output'."""
+        self.models[role] = model_stats(model)
+
+    def record(self, **values):
+        """Дополнительные метрики этапа (например, задержка инференса)."""
+        self.extra.update(values)
+
+    def to_record(self, ok=True):
+        rss = current_rss_bytes()
+        return {
+            'run_id': self.run_id,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'stage': self.stage,
+            'ok': bool(ok),
+            'input_path': self.input_path,
+            'output_path': self.output_path,
+            'input_bytes': _file_size(self.input_path),
+            'output_bytes': _file_size(self.output_path),
+            'wall_time_s': round(time.perf_counter() - self._started, 6),
+            'phases_s': {name: round(value, 6) for name, value in self.phases.items()},
+            'input_model': self.models.get('input'),
+            'output_model': self.models.get('output'),
+            # Пик за всю жизнь процесса: этапы, запущенные в одном процессе
+            # (build_matrix), наследуют пики предыдущих этапов
+            'process_peak_rss_bytes': peak_rss_bytes(),
+            'rss_growth_bytes': rss - self._start_rss if rss is not None and self._start_rss is not None else None,
+            **self.extra,
+        }
+
+    def write(self, ok=True):
+        """Дописывает запись этапа в журнал и возвращает ее."""
+        record = self.to_record(ok)
+        log_dir = os.path.dirname(self.log_path)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        with open(self.log_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+        return record
+
+
+class _NullTelemetry:
+    """Заглушка для запуска этапов без журнала (скрипты напрямую)."""
+
+    def lap(self, phase):
+        pass
+
+    def record_model(self, role, model):
+        pass
+
+    def record(self, **values):
+        pass
+
+
+NULL_TELEMETRY = _NullTelemetry()
+
+
+def start_stage(telemetry):
+    """Возвращает телеметрию этапа (или заглушку) и закрывает фазу 'import'.
+
+    CLI создает телеметрию до импорта модуля этапа, поэтому время импорта
+    onnx/onnxruntime учитывается отдельно и не попадает в фазу 'load'.
+    """
+    telemetry = telemetry if telemetry is not None else NULL_TELEMETRY
+    telemetry.lap('import')
+    return telemetry
+
+
+def read_run_log(log_path=DEFAULT_RUN_LOG):
+    """Построчно читает журнал запусков, пропуская поврежденные строки."""
+    if not os.path.exists(log_path):
+        return
+    with open(log_path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
+
+
+def stage_time(record):
+    """Время работы этапа без импорта модулей (зависит от окружения, а не от модели)."""
+    phases = record.get('phases_s') or {}
+    if phases:
+        return sum(value for name, value in phases.items() if name != 'import')
+    return record.get('wall_time_s')
+
+
+def _metrics(record):
+    output_model = record.get('output_model') or record.get('input_model') or {}
+    return {
+        'output_bytes': record.get('output_bytes'),
+        'nodes': output_model.get('nodes'),
+        'stage_time_s': stage_time(record),
+        'latency_ms': record.get('latency_ms'),
+    }
+
+
+def _grew(before, after, threshold):
+    if before is None or after is None:
+        return False
+    if before == 0:
+        return after > 0
+    return (after - before) / before > threshold
+
+
+def find_regressions(records, size_threshold=SIZE_THRESHOLD, latency_threshold=LATENCY_THRESHOLD):
+    """Сравнивает каждый успешный запуск этапа с предыдущим запуском того же этапа
+    на той же входной модели (и той же форме входа для бенчмарков).
+
+    Регрессией считается рост размера выхода больше `size_threshold`, любой
+    рост числа узлов и рост задержки инференса (или времени этапа, если
+    задержка не замерялась) больше `latency_threshold`.
+
+    Память не сравнивается: process_peak_rss_bytes - пик за всю жизнь
+    процесса и зависит от предыдущих этапов в нем, а rss_growth_bytes
+    зависит от аллокатора и сборщика мусора больше, чем от модели.
+
+    Returns:
+        list[dict]: Найденные регрессии с этапом, метрикой и значениями до/после.
+    """
+    previous = {}
+    regressions = []
+    for record in records:
+        if not record.get('ok', True):
+            continue
+        key = (record.get('stage'), record.get('input_path'), str(record.get('input_shape')))
+        current = _metrics(record)
+        before = previous.get(key)
+        if before is not None:
+            checks = [
+                ('output_bytes', size_threshold),
+                ('nodes', 0.0),
+                ('latency_ms' if current['latency_ms'] is not None else 'stage_time_s', latency_threshold),
+            ]
+            for metric, threshold in checks:
+                if _grew(before[metric], current[metric], threshold):
+                    regressions.append({
+                        'stage': record.get('stage'),
+                        'run_id': record.get('run_id'),
+                        'metric': metric,
+                        'before': before[metric],
+                        'after': current[metric],
+                    })
+        previous[key] = current
+    return regressions
+
+
+def _format_bytes(value):
+    if value is None:
+        return '-'
+    for unit in ('Б', 'КБ', 'МБ', 'ГБ'):
+        if abs(value) < 1024 or unit == 'ГБ':
+            return f"{value:.1f} {unit}" if unit != 'Б' else f"{value} {unit}"
+        value /= 1024.0
+
+
+def print_report(log_path=DEFAULT_RUN_LOG, stage=None, last=10,
+                 size_threshold=SIZE_THRESHOLD, latency_threshold=LATENCY_THRESHOLD):
+    """Печатает тренды по этапам и регрессии между запусками.
+
+    Returns:
+        list[dict]: Найденные регрессии (пустой список, если их нет).
+    """
+    records = [r for r in read_run_log(log_path) if stage is None or r.get('stage') == stage]
+    if not records:
+        print(f"Журнал запусков пуст или не найден: {log_path}")
+        return []
+
+    by_stage = {}
+    for record in records:
+        by_stage.setdefault(record.get('stage'), []).append(record)
+
+    print(f"Журнал запусков: {log_path} ({len(records)} записей)")
+    for stage_name, stage_records in by_stage.items():
+        print(f"\n=== {stage_name} ===")
+        print(f"  {'run_id':<24} {'время, с':>9} {'выход':>11} {'узлы':>7} {'иниц.':>7} {'ΔRSS':>11} {'пик RSS':>11} {'мс/инф.':>9}")
+        for record in stage_records[-last:]:
+            output_model = record.get('output_model') or record.get('input_model') or {}
+            latency = record.get('latency_ms')
+            print(f"  {str(record.get('run_id'))[:24]:<24} "
+                  f"{stage_time(record) or 0:>9.3f} "
+                  f"{_format_bytes(record.get('output_bytes')):>11} "
+                  f"{output_model.get('nodes', '-'):>7} "
+                  f"{output_model.get('initializers', '-'):>7} "
+                  f"{_format_bytes(record.get('rss_growth_bytes')):>11} "
+                  f"{_format_bytes(record.get('process_peak_rss_bytes', record.get('peak_rss_bytes'))):>11} "
+                  f"{(f'{latency:.2f}' if latency is not None else '-'):>9}"
+                  f"{'' if record.get('ok', True) else '  ОШИБКА'}")
+
+    regressions = find_regressions(records, size_threshold, latency_threshold)
+    if regressions:
+        print("\n❌ Обнаружены регрессии:")
+        for item in regressions:
+            print(f"  - {item['stage']} [{item['run_id']}]: {item['metric']} {item['before']} -> {item['after']}")
+    else:
+        print("\n✅ Регрессий не обнаружено")
+    return regressions
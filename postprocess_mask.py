@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Постобработка маски внутри графа: модель сразу выдает готовую маску [N, 1, H, W].
+
+Сейчас WallSegmentation.cs читает логиты на CPU, в цикле по пикселям
+применяет Sigmoid и порог уверенности, а затем размывает маску проходами
+Graphics.Blit (ApplyGaussianBlur, maskBlurSize). Этот этап дописывает
+то же самое в конец графа ONNX:
+
+    логиты -> выбор классов (Gather) -> Sigmoid / Softmax
+           -> билинейный Resize до разрешения маски
+           -> разделимое размытие по Гауссу (Pad edge + две Conv 1×K и K×1)
+           -> порог (Greater + Cast) -> выход 'mask'
+
+Все операторы входят в поддерживаемое Sentis подмножество, поэтому маска
+считается на GPU без чтения тензора на CPU.
+"""
+import os
+
+import numpy as np
+import onnx
+from onnx import TensorProto, helper
+
+from graph_rewrite import GraphRewriter, get_opset
+from model_classes import ADE20K_CLASSES
+from pipeline_telemetry import start_stage
+
+INPUT_MODEL = os.path.join('Assets', 'StreamingAssets', 'model_unity_final.onnx')
+OUTPUT_MODEL = os.path.join('Assets', 'StreamingAssets', 'model_unity_mask.onnx')
+MASK_OUTPUT = 'mask'
+ACTIVATIONS = ('sigmoid', 'softmax')
+
+# Значения по умолчанию как в WallSegmentation.cs
+DEFAULT_CLASSES = (ADE20K_CLASSES.index('wall'),)
+CONFIDENCE_THRESHOLD = 0.15  # segmentationConfidenceThreshold
+BLUR_SIZE = 4  # maskBlurSize
+
+
+def gaussian_kernel(radius, sigma=None):
+    """Нормированное одномерное ядро Гаусса длины 2 * radius + 1 (sigma по умолчанию radius / 2)."""
+    sigma = sigma or max(radius / 2.0, 0.5)
+    offsets = np.arange(-radius, radius + 1, dtype=np.float64)
+    kernel = np.exp(-0.5 * (offsets / sigma) ** 2)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+def _static_dims(value_info):
+    return [dim.dim_value if dim.HasField('dim_value') else None
+            for dim in value_info.type.tensor_type.shape.dim]
+
+
+def append_mask_postprocessing(model, classes=DEFAULT_CLASSES, activation='sigmoid', mask_size=None,
+                               blur_size=BLUR_SIZE, sigma=None, threshold=CONFIDENCE_THRESHOLD,
+                               keep_logits=False, output_name=MASK_OUTPUT):
+    """Дописывает постобработку маски к первому выходу модели (логиты [N, C, h, w]).
+
+    Args:
+        model (onnx.ModelProto): Модель, изменяется на месте.
+        classes (iterable[int]): Индексы классов маски; вероятности нескольких классов
+            объединяются (сумма для softmax, максимум для sigmoid).
+        activation (str): 'sigmoid' (как в WallSegmentation.cs) или 'softmax' по всем классам.
+        mask_size (tuple[int, int] | None): Разрешение маски (высота, ширина); None - как у входа модели.
+        blur_size (int): Радиус размытия по Гауссу; 0 - без размытия.
+        sigma (float | None): Сигма размытия (по умолчанию blur_size / 2).
+        threshold (float | None): Порог уверенности; None - выход остается вероятностью.
+        keep_logits (bool): Оставить исходный выход логитов.
+        output_name (str): Имя нового выхода.
+
+    Returns:
+        list[str]: Типы добавленных узлов по порядку.
+    """
+    if activation not in ACTIVATIONS:
+        raise ValueError(f"Неизвестная активация '{activation}', доступны: {', '.join(ACTIVATIONS)}")
+    classes = [int(c) for c in classes]
+    if not classes:
+        raise ValueError("Нужен хотя бы один класс маски")
+    graph = model.graph
+    logits_info = graph.output[0]
+    num_classes = _static_dims(logits_info)[1] if len(_static_dims(logits_info)) == 4 else None
+    if num_classes is not None and max(classes) >= num_classes:
+        raise ValueError(f"Класс {max(classes)} вне диапазона: у модели {num_classes} классов")
+
+    rewriter = GraphRewriter(model)
+    if rewriter.has_name(output_name):
+        raise ValueError(f"Имя '{output_name}' уже есть в графе - постобработка уже добавлена?")
+    added = []
+
+    def add(op_type, inputs, **attrs):
+        output = rewriter.unique_name(f"mask_{op_type.lower()}")
+        graph.node.append(helper.make_node(op_type, inputs, [output],
+                                           name=rewriter.unique_name(f"MaskPost_{op_type}"), **attrs))
+        added.append(op_type)
+        return output
+
+    def const(base, value, dtype):
+        return rewriter.add_constant(f"mask_{base}", np.array(value, dtype=dtype))
+
+    # 1-2. Выбор классов и активация. Softmax считается по всем классам до выбора
+    scores = logits_info.name
+    if activation == 'softmax':
+        scores = add('Softmax', [scores], axis=1)
+    selected = [add('Gather', [scores, const(f"class_{c}", [c], np.int64)], axis=1) for c in classes]
+    if activation == 'sigmoid':
+        selected = [add('Sigmoid', [value]) for value in selected]
+    if len(selected) > 1:
+        # Вероятность "любой из классов": для softmax сумма, для независимых sigmoid - максимум
+        probability = add('Sum' if activation == 'softmax' else 'Max', selected)
+    else:
+        probability = selected[0]
+
+    # 3. Билинейный Resize до разрешения маски: sizes = [N, 1] + (H, W)
+    batch_and_channel = add('Slice', [add('Shape', [probability]), const('begin', [0], np.int64),
+                                      const('end', [2], np.int64)])
+    if mask_size is None:
+        input_name = graph.input[0].name
+        spatial = add('Slice', [add('Shape', [input_name]), const('spatial_begin', [2], np.int64),
+                                const('spatial_end', [4], np.int64)])
+    else:
+        spatial = const('size', list(mask_size), np.int64)
+    sizes = add('Concat', [batch_and_channel, spatial], axis=0)
+    mask = add('Resize', [probability, '', '', sizes], mode='linear',
+               coordinate_transformation_mode='half_pixel')
+
+    # 4. Разделимое размытие: края дополняются повтором, как при clamp выборке текстуры
+    if blur_size and blur_size > 0:
+        kernel = gaussian_kernel(blur_size, sigma)
+        padded = add('Pad', [mask, const('blur_pads', [0, 0, blur_size, blur_size, 0, 0, blur_size, blur_size],
+                                         np.int64)], mode='edge')
+        horizontal = add('Conv', [padded, const('blur_kernel_x', kernel.reshape(1, 1, 1, -1), np.float32)],
+                         group=1, kernel_shape=[1, len(kernel)])
+        mask = add('Conv', [horizontal, const('blur_kernel_y', kernel.reshape(1, 1, -1, 1), np.float32)],
+                   group=1, kernel_shape=[len(kernel), 1])
+
+    # 5. Порог: бинарная маска 0/1 в float (Sentis неудобно отдавать bool)
+    if threshold is not None:
+        mask = add('Cast', [add('Greater', [mask, const('threshold', threshold, np.float32)])],
+                   to=TensorProto.FLOAT)
+
+    # Переименовываем последний выход в output_name, заменяя его и в выходе узла
+    graph.node[-1].output[0] = output_name
+    batch = _static_dims(logits_info)[0] or 'batch'
+    if not keep_logits:
+        del graph.output[0]
+    mask_height, mask_width = mask_size if mask_size is not None else ('mask_height', 'mask_width')
+    graph.output.append(helper.make_tensor_value_info(
+        output_name, TensorProto.FLOAT, [batch, 1, mask_height, mask_width]))
+    return added
+
+
+def add_mask_postprocessing(input_path=INPUT_MODEL, output_path=OUTPUT_MODEL, telemetry=None, **options):
+    """Этап конвейера: дописывает постобработку маски (параметры - как у append_mask_postprocessing)."""
+    telemetry = start_stage(telemetry)
+    print(f"Загружаю модель из {input_path}...")
+    try:
+        model = onnx.load(input_path)
+        print(f"Модель успешно загружена: {model.graph.name}")
+        telemetry.lap('load')
+        telemetry.record_model('input', model)
+
+        opset = get_opset(model)
+        if opset is None or opset < 13:
+            print(f"Ошибка: нужен opset 13+ (Pad, Slice и Resize со входами), у модели {opset}")
+            return False
+
+        added = append_mask_postprocessing(model, **options)
+        print(f"Добавлено узлов постобработки: {len(added)} ({' -> '.join(added)})")
+        print(f"Выходы модели: {', '.join(output.name for output in model.graph.output)}")
+        telemetry.lap('transform')
+
+        onnx.save(model, output_path)
+        print(f"Модель с постобработкой маски сохранена в {output_path}")
+        telemetry.record_model('output', model)
+        telemetry.lap('save')
+
+        print("Проверяем модель на ошибки...")
+        try:
+            onnx.checker.check_model(model)
+            print("✅ Проверка успешна! Модель соответствует спецификации ONNX.")
+        except Exception as check_error:
+            print(f"⚠️ ПРЕДУПРЕЖДЕНИЕ: Проверка модели выявила проблемы: {check_error}")
+
+        telemetry.lap('check')
+        return True
+    except Exception as e:
+        print(f"Ошибка: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    add_mask_postprocessing()
@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+"""
+Разбор разрешений входа модели из аргументов командной строки.
+
+Общий для инструментов пайплайна и среды экспорта model_conversion_env;
+использует только стандартную библиотеку.
+"""
+
+
+def parse_resolution(value):
+    """'512' -> (512, 512), '512x384' -> (512, 384) (высота x ширина)."""
+    parts = str(value).lower().split("x")
+    if len(parts) == 1:
+        return int(parts[0]), int(parts[0])
+    return int(parts[0]), int(parts[1])
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк масштабирования onnxruntime по ядрам для офлайн пакетной обработки.
+
+Отвечает на вопрос, что быстрее на сервере сборки: одна сессия с многими
+intra-op потоками или несколько однопоточных сессий в параллельных
+процессах. Перебираются раскладки
+
+    потоки на сессию × сессий в процессе × процессов × размер батча,
+
+где потоки × сессии × процессы - число занятых ядер. Каждая раскладка
+запускается отдельно: процессы (spawn) создают сессии через
+inspect_onnx_model.create_session, прогреваются, одновременно стартуют
+по барьеру и выполняют заданное число запросов в каждой сессии
+(сессии процесса крутятся в своих потоках Python - onnxruntime
+отпускает GIL на время run).
+
+Для каждой раскладки считаются суммарная пропускная способность
+(изображений в секунду), перцентили задержки запроса и пиковая память
+процесса; для каждого числа ядер выбирается лучшая раскладка.
+"""
+import itertools
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+import pipeline_telemetry
+
+DEFAULT_BATCH_SIZES = (1,)
+
+
+def _powers_of_two(limit):
+    values = [1]
+    while values[-1] * 2 <= limit:
+        values.append(values[-1] * 2)
+    return values
+
+
+def default_core_counts(cpu_count=None):
+    """1, 2, 4, ... до числа ядер, плюс само число ядер."""
+    cpu_count = cpu_count or os.cpu_count() or 1
+    return sorted(set(_powers_of_two(cpu_count)) | {cpu_count})
+
+
+def expand_layouts(core_counts, threads=None, sessions=None, processes=None, batch_sizes=DEFAULT_BATCH_SIZES):
+    """Все раскладки, у которых потоки × сессии × процессы входит в core_counts.
+
+    threads, sessions и processes по умолчанию - степени двойки до максимума core_counts.
+    """
+    max_cores = max(core_counts)
+    options = [values or _powers_of_two(max_cores) for values in (threads, sessions, processes)]
+    layouts = []
+    for t, s, p, b in itertools.product(*options, batch_sizes):
+        cores = t * s * p
+        if cores in core_counts:
+            layouts.append({'cores': cores, 'threads': t, 'sessions': s, 'processes': p, 'batch_size': b,
+                            'name': f"{t}t×{s}s×{p}p b{b}"})
+    layouts.sort(key=lambda layout: (layout['cores'], layout['batch_size'], -layout['threads'], -layout['sessions']))
+    return layouts
+
+
+def _make_batch(height, width, batch_size, corpus=None):
+    """Входной батч [batch, 3, h, w] float32 из корпуса или тестового градиента."""
+    if corpus is None:
+        from inspect_onnx_model import make_input_tensor, make_test_image
+        frame = make_input_tensor(make_test_image(height, width))
+        return np.repeat(frame, batch_size, axis=0)
+    from input_corpus import InputCorpus
+    frames = InputCorpus(corpus)
+    if len(frames) == 0:
+        raise ValueError(f"Корпус {corpus} пуст: нет кадров для батча")
+    array = frames.array(height, width)
+    # Если кадров меньше батча, повторяем их по кругу
+    indices = np.arange(batch_size) % len(array)
+    return np.ascontiguousarray(array[indices], dtype=np.float32)
+
+
+def _worker(model_path, layout, height, width, corpus, warmup, requests, barrier, queue):
+    """Процесс раскладки: свои сессии, прогрев, общий старт по барьеру, замер запросов."""
+    from inspect_onnx_model import create_session
+
+    try:
+        batch = _make_batch(height, width, layout['batch_size'], corpus)
+        sessions = [create_session(model_path, layout['threads']) for _ in range(layout['sessions'])]
+        input_name = sessions[0].get_inputs()[0].name
+        for session in sessions:
+            for _ in range(warmup):
+                session.run(None, {input_name: batch})
+    except Exception as e:
+        barrier.abort()
+        queue.put({'error': str(e)})
+        return
+
+    latencies = [[] for _ in sessions]
+    errors = []
+
+    def drive(index):
+        session = sessions[index]
+        try:
+            for _ in range(requests):
+                start_time = time.perf_counter()
+                session.run(None, {input_name: batch})
+                latencies[index].append((time.perf_counter() - start_time) * 1000.0)
+        except Exception as e:
+            # Исключение в потоке иначе теряется, и раскладка выглядела бы успешной
+            errors.append(f"сессия {index}: {e}")
+
+    threads = [threading.Thread(target=drive, args=(i,)) for i in range(len(sessions))]
+    try:
+        barrier.wait()
+    except threading.BrokenBarrierError:
+        # Другой процесс раскладки упал при подготовке; без отчета run_layout ждал бы таймаут
+        queue.put({'error': 'барьер прерван: другой процесс раскладки не запустился'})
+        return
+    # perf_counter на Linux - CLOCK_MONOTONIC, общий для всех процессов
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    finished = time.perf_counter()
+    if errors:
+        queue.put({'error': errors[0]})
+        return
+
+    latencies_ms = [value for values in latencies for value in values]
+    queue.put({
+        'start': started,
+        'end': finished,
+        'latencies_ms': latencies_ms,
+        'images': len(latencies_ms) * layout['batch_size'],
+        'peak_rss_bytes': pipeline_telemetry.peak_rss_bytes(),
+    })
+
+
+def run_layout(model_path, layout, height, width, corpus=None, warmup=2, requests=20, timeout=600):
+    """Запускает одну раскладку и возвращает её метрики."""
+    import multiprocessing
+    import queue as queue_module
+
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(layout['processes'])
+    queue = context.Queue()
+    workers = [context.Process(target=_worker,
+                               args=(model_path, layout, height, width, corpus, warmup, requests, barrier, queue))
+               for _ in range(layout['processes'])]
+    for worker in workers:
+        worker.start()
+
+    reports = []
+    try:
+        for _ in workers:
+            reports.append(queue.get(timeout=timeout))
+            if 'error' in reports[-1]:
+                break
+    except queue_module.Empty:
+        reports.append({'error': f"нет ответа от процесса за {timeout} с"})
+    finally:
+        for worker in workers:
+            worker.join(timeout=5)
+            if worker.is_alive():
+                worker.terminate()
+
+    result = dict(layout)
+    errors = [report['error'] for report in reports if 'error' in report]
+    if errors:
+        result.update(ok=False, error=errors[0])
+        return result
+
+    wall_time = max(r['end'] for r in reports) - min(r['start'] for r in reports)
+    latencies = np.array([value for r in reports for value in r['latencies_ms']])
+    rss = [r['peak_rss_bytes'] or 0 for r in reports]
+    result.update(
+        ok=True,
+        wall_time_s=wall_time,
+        images=sum(r['images'] for r in reports),
+        throughput_ips=sum(r['images'] for r in reports) / wall_time,
+        latency_p50_ms=float(np.percentile(latencies, 50)),
+        latency_p90_ms=float(np.percentile(latencies, 90)),
+        latency_p99_ms=float(np.percentile(latencies, 99)),
+        worker_rss_mb=max(rss) / (1024 * 1024),
+        total_rss_mb=sum(rss) / (1024 * 1024),
+    )
+    return result
+
+
+def _input_geometry(model_path, height, width):
+    """Размер входа из статической формы модели, иначе из аргументов; и статический батч, если есть."""
+    from inspect_onnx_model import create_session
+
+    shape = create_session(model_path, 1).get_inputs()[0].shape
+    static = [dim if isinstance(dim, int) else None for dim in shape]
+    return static[2] or height, static[3] or width, static[0]
+
+
+def best_by_cores(results):
+    """Лучшая раскладка для каждого числа ядер: максимум пропускной способности."""
+    best = {}
+    for result in results:
+        if not result['ok']:
+            continue
+        current = best.get(result['cores'])
+        if current is None or result['throughput_ips'] > current['throughput_ips']:
+            best[result['cores']] = result
+    return dict(sorted(best.items()))
+
+
+def print_table(results, best):
+    header = (f"{'ядра':>4} {'раскладка':<18} {'изобр./с':>9} {'p50, мс':>8} {'p90, мс':>8} {'p99, мс':>8} "
+              f"{'RSS/проц., МБ':>13} {'RSS всего, МБ':>13}")
+    print(header)
+    print('-' * len(header))
+    best_names = {result['name'] for result in best.values()}
+    for result in results:
+        if not result['ok']:
+            print(f"{result['cores']:>4} {result['name']:<18} ❌ {result['error']}")
+            continue
+        mark = ' ★' if result['name'] in best_names else ''
+        print(f"{result['cores']:>4} {result['name']:<18} {result['throughput_ips']:>9.1f} "
+              f"{result['latency_p50_ms']:>8.2f} {result['latency_p90_ms']:>8.2f} {result['latency_p99_ms']:>8.2f} "
+              f"{result['worker_rss_mb']:>13.0f} {result['total_rss_mb']:>13.0f}{mark}")
+
+
+def run_scaling(model_path, core_counts=None, threads=None, sessions=None, processes=None,
+                batch_sizes=DEFAULT_BATCH_SIZES, height=320, width=320, corpus=None, warmup=2, requests=20,
+                output_path=None):
+    """Перебирает раскладки, печатает таблицу и лучшие конфигурации по числу ядер.
+
+    Args:
+        model_path (str): Путь к подготовленной модели ONNX.
+        core_counts (list[int] | None): Числа ядер (по умолчанию 1, 2, 4, ... до os.cpu_count()).
+        threads, sessions, processes (list[int] | None): Ограничить перебор этими значениями.
+        batch_sizes (list[int]): Размеры батча.
+        height (int): Высота входа для динамической модели.
+        width (int): Ширина входа для динамической модели.
+        corpus (str | None): Директория корпуса input_corpus.py вместо тестового градиента.
+        warmup (int): Прогревочных запусков на сессию.
+        requests (int): Замеряемых запросов на сессию.
+        output_path (str | None): Куда сохранить результаты JSON.
+
+    Returns:
+        dict: {число ядер: лучшая раскладка}.
+    """
+    if not os.path.exists(model_path):
+        print(f"Ошибка: Файл модели не найден: {model_path}")
+        return None
+    core_counts = core_counts or default_core_counts()
+    if max(core_counts) > (os.cpu_count() or 1):
+        print(f"⚠️ Запрошено до {max(core_counts)} ядер, доступно {os.cpu_count()}: "
+              f"результаты для больших значений покажут переподписку, а не масштабирование")
+    height, width, static_batch = _input_geometry(model_path, height, width)
+    if static_batch and static_batch != 1 and list(batch_sizes) == list(DEFAULT_BATCH_SIZES):
+        batch_sizes = [static_batch]
+    layouts = expand_layouts(core_counts, threads, sessions, processes, batch_sizes)
+    if static_batch:
+        skipped = [layout for layout in layouts if layout['batch_size'] != static_batch]
+        if skipped:
+            print(f"Модель со статическим батчем {static_batch}: пропущено раскладок: {len(skipped)}")
+        layouts = [layout for layout in layouts if layout['batch_size'] == static_batch]
+    if not layouts:
+        print("Нет раскладок для указанных параметров")
+        return None
+
+    print(f"Масштабирование {model_path}: вход {height}x{width}, ядра {core_counts} "
+          f"(доступно {os.cpu_count()}), раскладок: {len(layouts)}, запросов на сессию: {requests}")
+    results = []
+    for layout in layouts:
+        print(f"▶ {layout['cores']} ядер: {layout['name']}", flush=True)
+        results.append(run_layout(model_path, layout, height, width, corpus, warmup, requests))
+
+    best = best_by_cores(results)
+    print()
+    print_table(results, best)
+    print("\nЛучшая раскладка по числу ядер:")
+    for cores, result in best.items():
+        print(f"  {cores:>3}: {result['threads']} потоков × {result['sessions']} сессий × "
+              f"{result['processes']} процессов, батч {result['batch_size']} - "
+              f"{result['throughput_ips']:.1f} изобр./с, p90 {result['latency_p90_ms']:.2f} мс")
+
+    if output_path:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump({'model': model_path, 'height': height, 'width': width, 'results': results,
+                       'best_by_cores': {str(k): v['name'] for k, v in best.items()}},
+                      f, ensure_ascii=False, indent=2)
+        print(f"\nРезультаты сохранены в {output_path}")
+    return best
@@ -0,0 +1,806 @@
+#!/usr/bin/env python3
+"""
+Эталонный исполнитель подмножества операторов Unity Sentis на NumPy.
+
+Выполняет подготовленную ONNX модель без Unity и onnxruntime, реализуя
+только операторы из SUPPORTED_OPERATORS с ограничениями Sentis на
+атрибуты и типы данных. В отличие от analyze_model_compatibility.py,
+проверяется не только имя оператора, но и то, что граф реально
+выполняется: атрибут `split` у Split, атрибутная форма axes у
+Unsqueeze/Squeeze/ReduceSum в opset 13+, неподдерживаемые режимы Resize/Pad,
+недопустимые типы тензоров, нарушенный топологический порядок.
+
+Для каждого узла замеряется время и объем выделенной памяти выходов,
+а по времени жизни тензоров считается пиковый объем живых данных.
+"""
+import time
+
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper
+
+from analyze_model_compatibility import SUPPORTED_OPERATORS
+
+# Sentis хранит тензоры как float32 или int32; int64 сужается при импорте
+ALLOWED_DTYPES = {np.dtype(np.float32), np.dtype(np.int32), np.dtype(np.int64), np.dtype(np.bool_)}
+# float16 допустим только для констант: Sentis преобразует их при импорте
+ALLOWED_INITIALIZER_DTYPES = ALLOWED_DTYPES | {np.dtype(np.float16)}
+MAX_RANK = 8
+INT32_MAX = np.iinfo(np.int32).max
+
+# Операторы из списка поддерживаемых, которые эталонный исполнитель не эмулирует
+NOT_EMULATED = {'Loop', 'Scan', 'LSTM'}
+
+
+class SentisCompatibilityError(Exception):
+    """Граф использует конструкцию, которую Sentis не выполнит."""
+
+    def __init__(self, node, message):
+        self.node = node
+        label = f"{node.op_type} '{node.name}'" if node is not None else "граф"
+        super().__init__(f"{label}: {message}")
+
+
+def _attrs(node):
+    return {attr.name: helper.get_attribute_value(attr) for attr in node.attribute}
+
+
+def _decode(value):
+    return value.decode('utf-8') if isinstance(value, bytes) else value
+
+
+def _opset_version(model):
+    for opset in model.opset_import:
+        if opset.domain in ('', 'ai.onnx'):
+            return opset.version
+    return 0
+
+
+# --- Статические ограничения Sentis ---
+
+def _restriction_issues(node, opset):
+    """Возвращает список нарушений ограничений Sentis для узла (без выполнения)."""
+    issues = []
+    attrs = _attrs(node)
+    if node.domain not in ('', 'ai.onnx'):
+        issues.append(f"домен '{node.domain}' не поддерживается")
+        return issues
+    if node.op_type not in SUPPORTED_OPERATORS:
+        issues.append("оператор не поддерживается Sentis")
+        return issues
+    if node.op_type in NOT_EMULATED:
+        issues.append("оператор не эмулируется эталонным исполнителем")
+    if node.op_type == 'Split' and 'split' in attrs:
+        issues.append("атрибут 'split' не поддерживается, размеры частей нужно подавать вторым входом")
+    if node.op_type in ('Unsqueeze', 'Squeeze') and opset >= 13 and 'axes' in attrs:
+        issues.append(f"атрибут 'axes' недопустим в opset {opset}, оси должны быть входом")
+    if node.op_type == 'ReduceSum' and opset >= 13 and 'axes' in attrs:
+        issues.append(f"атрибут 'axes' недопустим в opset {opset}, оси должны быть входом")
+    if node.op_type.startswith('Reduce') and node.op_type != 'ReduceSum' and opset >= 18 and 'axes' in attrs:
+        issues.append(f"атрибут 'axes' недопустим в opset {opset}, оси должны быть входом")
+    if node.op_type == 'Resize' and _decode(attrs.get('mode', 'nearest')) not in ('nearest', 'linear'):
+        issues.append(f"режим Resize '{_decode(attrs['mode'])}' не поддерживается")
+    if node.op_type == 'Pad' and _decode(attrs.get('mode', 'constant')) not in ('constant', 'reflect', 'edge'):
+        issues.append(f"режим Pad '{_decode(attrs['mode'])}' не поддерживается")
+    if node.op_type in ('Conv', 'ConvTranspose', 'MaxPool', 'AveragePool') \
+            and _decode(attrs.get('auto_pad', 'NOTSET')) not in ('NOTSET', 'VALID'):
+        issues.append(f"auto_pad '{_decode(attrs['auto_pad'])}' нужно заменить явными pads")
+    return issues
+
+
+def validate_model(model):
+    """Статическая проверка графа на ограничения Sentis.
+
+    Returns:
+        list[str]: Найденные проблемы (пустой список - граф допустим).
+    """
+    opset = _opset_version(model)
+    issues = []
+    for initializer in model.graph.initializer:
+        dtype = helper.tensor_dtype_to_np_dtype(initializer.data_type)
+        if dtype not in ALLOWED_INITIALIZER_DTYPES:
+            issues.append(f"инициализатор '{initializer.name}': тип {dtype} не поддерживается")
+    available = {i.name for i in model.graph.input} | {i.name for i in model.graph.initializer} | {''}
+    for node in model.graph.node:
+        for message in _restriction_issues(node, opset):
+            issues.append(f"{node.op_type} '{node.name}': {message}")
+        for name in node.input:
+            if name not in available:
+                issues.append(f"{node.op_type} '{node.name}': вход '{name}' вычисляется позже "
+                              f"(нарушен топологический порядок)")
+        available.update(node.output)
+    return issues
+
+
+# --- Вспомогательные функции ядер ---
+
+def _float(x):
+    return np.asarray(x, dtype=np.float32)
+
+
+def _pads_nd(pads, spatial):
+    if pads is None:
+        return [0] * spatial, [0] * spatial
+    return list(pads[:spatial]), list(pads[spatial:])
+
+
+def _pad_spatial(x, begin, end, value=0.0):
+    if not any(begin) and not any(end):
+        return x
+    width = [(0, 0), (0, 0)] + list(zip(begin, end))
+    return np.pad(x, width, mode='constant', constant_values=value)
+
+
+def _windows(x, kernel, strides, dilations):
+    """Окна свертки/пулинга [N, C, *out, *kernel] без копирования данных."""
+    spatial = len(kernel)
+    span = [(k - 1) * d + 1 for k, d in zip(kernel, dilations)]
+    view = np.lib.stride_tricks.sliding_window_view(x, span, axis=tuple(range(2, 2 + spatial)))
+    index = (slice(None), slice(None))
+    index += tuple(slice(None, None, s) for s in strides)
+    index += tuple(slice(None, None, d) for d in dilations)
+    return view[index]
+
+
+def _erf(x):
+    # Abramowitz-Stegun 7.1.26, погрешность < 1.5e-7 - достаточно для float32
+    x64 = x.astype(np.float64)
+    sign = np.sign(x64)
+    a = np.abs(x64)
+    t = 1.0 / (1.0 + 0.3275911 * a)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741 + t * (-1.453152027 + t * 1.061405429))))
+    return (sign * (1.0 - poly * np.exp(-a * a))).astype(x.dtype)
+
+
+def _reduce_axes(node, inputs, attrs, opset, input_axes_since):
+    if opset >= input_axes_since:
+        axes = inputs[1] if len(inputs) > 1 and inputs[1] is not None else None
+    else:
+        axes = attrs.get('axes')
+    if axes is None or len(axes) == 0:
+        if attrs.get('noop_with_empty_axes', 0):
+            return ()
+        return None
+    return tuple(int(a) for a in axes)
+
+
+# --- Ядра операторов: f(node, inputs, attrs, opset) -> list выходов ---
+
+def _unary(fn):
+    return lambda node, inputs, attrs, opset: [fn(inputs[0])]
+
+
+def _binary(fn):
+    return lambda node, inputs, attrs, opset: [fn(inputs[0], inputs[1])]
+
+
+def _variadic(fn):
+    def kernel(node, inputs, attrs, opset):
+        result = inputs[0]
+        for value in inputs[1:]:
+            result = fn(result, value)
+        return [result]
+    return kernel
+
+
+def _conv(node, inputs, attrs, opset):
+    x, w = inputs[0], inputs[1]
+    bias = inputs[2] if len(inputs) > 2 else None
+    spatial = x.ndim - 2
+    kernel = list(attrs.get('kernel_shape', w.shape[2:]))
+    strides = list(attrs.get('strides', [1] * spatial))
+    dilations = list(attrs.get('dilations', [1] * spatial))
+    begin, end = _pads_nd(attrs.get('pads'), spatial)
+    group = attrs.get('group', 1)
+
+    windows = _windows(_pad_spatial(x, begin, end), kernel, strides, dilations)
+    n, c = windows.shape[:2]
+    out_spatial = windows.shape[2:2 + spatial]
+    m = w.shape[0]
+    windows = windows.reshape(n, group, c // group, *out_spatial, *kernel)
+    weights = w.reshape(group, m // group, c // group, *kernel)
+    letters = 'hwdefg'[:spatial]
+    klet = 'ijklmn'[:spatial]
+    y = np.einsum(f"nGc{letters}{klet},GMc{klet}->nGM{letters}", windows, weights, optimize=True)
+    y = y.reshape(n, m, *out_spatial)
+    if bias is not None:
+        y = y + bias.reshape(1, -1, *([1] * spatial))
+    return [y.astype(x.dtype)]
+
+
+def _conv_transpose(node, inputs, attrs, opset):
+    x, w = inputs[0], inputs[1]
+    bias = inputs[2] if len(inputs) > 2 else None
+    spatial = x.ndim - 2
+    group = attrs.get('group', 1)
+    kernel = list(attrs.get('kernel_shape', w.shape[2:]))
+    strides = list(attrs.get('strides', [1] * spatial))
+    dilations = list(attrs.get('dilations', [1] * spatial))
+    begin, end = _pads_nd(attrs.get('pads'), spatial)
+    output_padding = list(attrs.get('output_padding', [0] * spatial))
+
+    # Транспонированная свертка = свертка входа, разреженного нулями, с перевернутым ядром
+    n, c = x.shape[:2]
+    dilated_shape = [(size - 1) * s + 1 for size, s in zip(x.shape[2:], strides)]
+    dilated = np.zeros((n, c, *dilated_shape), dtype=x.dtype)
+    dilated[(slice(None), slice(None)) + tuple(slice(None, None, s) for s in strides)] = x
+    full = [(k - 1) * d for k, d in zip(kernel, dilations)]
+    pad_begin = [f - b for f, b in zip(full, begin)]
+    pad_end = [f - e + op for f, e, op in zip(full, end, output_padding)]
+    if min(pad_begin + pad_end) < 0:
+        raise SentisCompatibilityError(node, "pads больше размера ядра не поддерживаются")
+    m_per_group = w.shape[1]
+    flipped = np.flip(w, axis=tuple(range(2, 2 + spatial)))
+    # [C, M/g, k...] -> [M, C/g, k...]
+    flipped = flipped.reshape(group, c // group, m_per_group, *kernel).swapaxes(1, 2)
+    flipped = flipped.reshape(group * m_per_group, c // group, *kernel)
+    conv_attrs = {'dilations': dilations, 'group': group,
+                  'pads': pad_begin + pad_end, 'strides': [1] * spatial}
+    inputs = [dilated, np.ascontiguousarray(flipped)] + ([bias] if bias is not None else [])
+    return _conv(node, inputs, conv_attrs, opset)
+
+
+def _pool(reduce_max):
+    def kernel(node, inputs, attrs, opset):
+        x = inputs[0]
+        spatial = x.ndim - 2
+        kernel_shape = list(attrs['kernel_shape'])
+        strides = list(attrs.get('strides', [1] * spatial))
+        dilations = list(attrs.get('dilations', [1] * spatial))
+        begin, end = _pads_nd(attrs.get('pads'), spatial)
+        if attrs.get('ceil_mode', 0):
+            # Дополняем конец так, чтобы последнее неполное окно тоже вошло
+            for i in range(spatial):
+                span = (kernel_shape[i] - 1) * dilations[i] + 1
+                size = x.shape[2 + i] + begin[i] + end[i]
+                remainder = (size - span) % strides[i]
+                if remainder:
+                    end[i] += strides[i] - remainder
+        axes = tuple(range(-spatial, 0))
+        if reduce_max:
+            windows = _windows(_pad_spatial(x, begin, end, -np.inf), kernel_shape, strides, dilations)
+            return [windows.max(axis=axes).astype(x.dtype)]
+        windows = _windows(_pad_spatial(x, begin, end), kernel_shape, strides, dilations)
+        total = windows.sum(axis=axes)
+        if attrs.get('count_include_pad', 0):
+            return [(total / np.prod(kernel_shape)).astype(x.dtype)]
+        ones = _pad_spatial(np.ones((1, 1) + x.shape[2:], dtype=x.dtype), begin, end)
+        counts = _windows(ones, kernel_shape, strides, dilations).sum(axis=axes)
+        return [(total / counts).astype(x.dtype)]
+    return kernel
+
+
+def _gemm(node, inputs, attrs, opset):
+    a, b = inputs[0], inputs[1]
+    if attrs.get('transA', 0):
+        a = a.T
+    if attrs.get('transB', 0):
+        b = b.T
+    y = attrs.get('alpha', 1.0) * (a @ b)
+    if len(inputs) > 2 and inputs[2] is not None:
+        y = y + attrs.get('beta', 1.0) * inputs[2]
+    return [y.astype(inputs[0].dtype)]
+
+
+def _batch_norm(node, inputs, attrs, opset):
+    x, scale, bias, mean, var = inputs[:5]
+    shape = (1, -1) + (1,) * (x.ndim - 2)
+    inv = scale / np.sqrt(var + attrs.get('epsilon', 1e-5))
+    return [(x - mean.reshape(shape)) * inv.reshape(shape) + bias.reshape(shape)]
+
+
+def _instance_norm(node, inputs, attrs, opset):
+    x, scale, bias = inputs
+    axes = tuple(range(2, x.ndim))
+    mean = x.mean(axis=axes, keepdims=True)
+    var = x.var(axis=axes, keepdims=True)
+    shape = (1, -1) + (1,) * (x.ndim - 2)
+    y = (x - mean) / np.sqrt(var + attrs.get('epsilon', 1e-5))
+    return [(y * scale.reshape(shape) + bias.reshape(shape)).astype(x.dtype)]
+
+
+def _softmax(node, inputs, attrs, opset):
+    x = inputs[0]
+    if opset < 13:
+        # До opset 13 softmax считается по всем осям начиная с axis
+        axis = attrs.get('axis', 1) % x.ndim
+        flat = x.reshape(int(np.prod(x.shape[:axis])), -1)
+        e = np.exp(flat - flat.max(axis=1, keepdims=True))
+        return [(e / e.sum(axis=1, keepdims=True)).reshape(x.shape)]
+    axis = attrs.get('axis', -1)
+    e = np.exp(x - x.max(axis=axis, keepdims=True))
+    return [e / e.sum(axis=axis, keepdims=True)]
+
+
+def _reduce(fn, input_axes_since=18):
+    def kernel(node, inputs, attrs, opset):
+        axes = _reduce_axes(node, inputs, attrs, opset, input_axes_since)
+        x = inputs[0]
+        if axes == ():
+            return [x]
+        keepdims = bool(attrs.get('keepdims', 1))
+        return [np.asarray(fn(x, axis=axes, keepdims=keepdims)).astype(x.dtype)]
+    return kernel
+
+
+def _reshape(node, inputs, attrs, opset):
+    x, shape = inputs[0], [int(s) for s in inputs[1]]
+    if not attrs.get('allowzero', 0):
+        shape = [x.shape[i] if s == 0 else s for i, s in enumerate(shape)]
+    return [x.reshape(shape)]
+
+
+def _transpose(node, inputs, attrs, opset):
+    perm = attrs.get('perm')
+    return [np.transpose(inputs[0], perm)]
+
+
+def _squeeze(node, inputs, attrs, opset):
+    x = inputs[0]
+    axes = inputs[1] if opset >= 13 and len(inputs) > 1 else attrs.get('axes')
+    if axes is None:
+        return [np.squeeze(x)]
+    return [np.squeeze(x, axis=tuple(int(a) for a in axes))]
+
+
+def _unsqueeze(node, inputs, attrs, opset):
+    x = inputs[0]
+    axes = inputs[1] if opset >= 13 else attrs['axes']
+    rank = x.ndim + len(axes)
+    for axis in sorted(int(a) % rank for a in axes):
+        x = np.expand_dims(x, axis)
+    return [x]
+
+
+def _flatten(node, inputs, attrs, opset):
+    x = inputs[0]
+    axis = attrs.get('axis', 1) % (x.ndim + 1) if x.ndim else 0
+    return [x.reshape(int(np.prod(x.shape[:axis])), -1)]
+
+
+def _concat(node, inputs, attrs, opset):
+    return [np.concatenate([i for i in inputs if i is not None], axis=attrs['axis'])]
+
+
+def _split(node, inputs, attrs, opset):
+    x = inputs[0]
+    axis = attrs.get('axis', 0)
+    if len(inputs) > 1 and inputs[1] is not None:
+        sizes = [int(s) for s in inputs[1]]
+    elif 'split' in attrs:
+        sizes = list(attrs['split'])
+    else:
+        parts = attrs.get('num_outputs', len(node.output))
+        step = -(-x.shape[axis] // parts)
+        sizes = [min(step, x.shape[axis] - i * step) for i in range(parts)]
+    return np.split(x, np.cumsum(sizes)[:-1], axis=axis)
+
+
+def _slice(node, inputs, attrs, opset):
+    x = inputs[0]
+    if opset < 10:
+        starts, ends = attrs['starts'], attrs['ends']
+        axes = attrs.get('axes', list(range(len(starts))))
+        steps = [1] * len(starts)
+    else:
+        starts, ends = inputs[1], inputs[2]
+        axes = inputs[3] if len(inputs) > 3 and inputs[3] is not None else list(range(len(starts)))
+        steps = inputs[4] if len(inputs) > 4 and inputs[4] is not None else [1] * len(starts)
+    index = [slice(None)] * x.ndim
+    for start, end, axis, step in zip(starts, ends, axes, steps):
+        # Sentis хранит индексы в int32: INT64_MAX и подобные значения обрезаются
+        start = int(np.clip(start, -INT32_MAX, INT32_MAX))
+        end = int(np.clip(end, -INT32_MAX - 1, INT32_MAX))
+        index[int(axis)] = slice(start, end, int(step))
+    return [x[tuple(index)]]
+
+
+def _gather(node, inputs, attrs, opset):
+    return [np.take(inputs[0], inputs[1].astype(np.int64), axis=attrs.get('axis', 0))]
+
+
+def _expand(node, inputs, attrs, opset):
+    x = inputs[0]
+    shape = np.broadcast_shapes(x.shape, tuple(int(s) for s in inputs[1]))
+    return [np.broadcast_to(x, shape).copy()]
+
+
+def _tile(node, inputs, attrs, opset):
+    return [np.tile(inputs[0], [int(r) for r in inputs[1]])]
+
+
+def _shape(node, inputs, attrs, opset):
+    shape = np.array(inputs[0].shape, dtype=np.int64)
+    start = attrs.get('start', 0)
+    end = attrs.get('end')
+    return [shape[start:end]]
+
+
+def _constant(node, inputs, attrs, opset):
+    if 'value' in attrs:
+        return [numpy_helper.to_array(attrs['value'])]
+    for name, dtype in (('value_float', np.float32), ('value_floats', np.float32),
+                        ('value_int', np.int64), ('value_ints', np.int64)):
+        if name in attrs:
+            return [np.array(attrs[name], dtype=dtype)]
+    raise SentisCompatibilityError(node, "вид Constant не поддерживается")
+
+
+def _constant_of_shape(node, inputs, attrs, opset):
+    value = numpy_helper.to_array(attrs['value']) if 'value' in attrs else np.zeros(1, dtype=np.float32)
+    return [np.full([int(s) for s in inputs[0]], value.reshape(-1)[0], dtype=value.dtype)]
+
+
+def _cast(node, inputs, attrs, opset):
+    dtype = helper.tensor_dtype_to_np_dtype(attrs['to'])
+    return [inputs[0].astype(dtype)]
+
+
+def _clip(node, inputs, attrs, opset):
+    x = inputs[0]
+    if opset < 11:
+        low, high = attrs.get('min'), attrs.get('max')
+    else:
+        low = inputs[1] if len(inputs) > 1 and inputs[1] is not None else None
+        high = inputs[2] if len(inputs) > 2 and inputs[2] is not None else None
+    if low is not None:
+        x = np.maximum(x, low)
+    if high is not None:
+        x = np.minimum(x, high)
+    return [x.astype(inputs[0].dtype)]
+
+
+def _pad(node, inputs, attrs, opset):
+    x = inputs[0]
+    mode = _decode(attrs.get('mode', 'constant'))
+    if opset < 11:
+        pads, value, axes = attrs['pads'], attrs.get('value', 0.0), None
+    else:
+        pads = [int(p) for p in inputs[1]]
+        value = inputs[2].reshape(-1)[0] if len(inputs) > 2 and inputs[2] is not None and inputs[2].size else 0
+        axes = inputs[3] if len(inputs) > 3 and inputs[3] is not None else None
+    axes = [int(a) % x.ndim for a in axes] if axes is not None else list(range(x.ndim))
+    half = len(pads) // 2
+    width = [(0, 0)] * x.ndim
+    for i, axis in enumerate(axes):
+        width[axis] = (pads[i], pads[i + half])
+    if min(min(w) for w in width) < 0:
+        raise SentisCompatibilityError(node, "отрицательные pads не поддерживаются")
+    if mode == 'constant':
+        return [np.pad(x, width, mode='constant', constant_values=value)]
+    return [np.pad(x, width, mode={'reflect': 'reflect', 'edge': 'edge'}[mode])]
+
+
+def _resize_coordinates(out_size, in_size, scale, mode):
+    out = np.arange(out_size, dtype=np.float64)
+    if mode == 'align_corners':
+        return out * (in_size - 1) / (out_size - 1) if out_size > 1 else np.zeros(1)
+    if mode == 'asymmetric':
+        return out / scale
+    if mode == 'pytorch_half_pixel':
+        return (out + 0.5) / scale - 0.5 if out_size > 1 else np.zeros(1)
+    # half_pixel
+    return (out + 0.5) / scale - 0.5
+
+
+def _resize(node, inputs, attrs, opset):
+    x = inputs[0]
+    mode = _decode(attrs.get('mode', 'nearest'))
+    transform = _decode(attrs.get('coordinate_transformation_mode', 'half_pixel' if opset >= 11 else 'asymmetric'))
+    nearest_mode = _decode(attrs.get('nearest_mode', 'round_prefer_floor'))
+    if opset < 11:
+        scales, sizes = inputs[1], None
+    else:
+        scales = inputs[2] if len(inputs) > 2 and inputs[2] is not None and inputs[2].size else None
+        sizes = inputs[3] if len(inputs) > 3 and inputs[3] is not None and inputs[3].size else None
+    if sizes is not None:
+        sizes = [int(s) for s in sizes]
+        scales = [o / i for o, i in zip(sizes, x.shape)]
+    else:
+        scales = [float(s) for s in scales]
+        sizes = [int(np.floor(i * s)) for i, s in zip(x.shape, scales)]
+
+    y = x.astype(np.float32, copy=False)
+    # Интерполяция раскладывается на последовательные одномерные по каждой оси
+    for axis, (in_size, out_size, scale) in enumerate(zip(x.shape, sizes, scales)):
+        if in_size == out_size and scale == 1.0:
+            continue
+        coords = _resize_coordinates(out_size, in_size, scale, transform)
+        if mode == 'nearest':
+            if nearest_mode == 'floor':
+                index = np.floor(coords)
+            elif nearest_mode == 'ceil':
+                index = np.ceil(coords)
+            elif nearest_mode == 'round_prefer_ceil':
+                index = np.floor(coords + 0.5)
+            else:
+                index = np.ceil(coords - 0.5)
+            y = np.take(y, np.clip(index, 0, in_size - 1).astype(np.int64), axis=axis)
+            continue
+        coords = np.clip(coords, 0, in_size - 1)
+        low = np.floor(coords).astype(np.int64)
+        high = np.minimum(low + 1, in_size - 1)
+        frac = (coords - low).astype(np.float32)
+        shape = [1] * y.ndim
+        shape[axis] = out_size
+        frac = frac.reshape(shape)
+        y = np.take(y, low, axis=axis) * (1 - frac) + np.take(y, high, axis=axis) * frac
+    return [y.astype(x.dtype)]
+
+
+def _where(node, inputs, attrs, opset):
+    return [np.where(inputs[0], inputs[1], inputs[2])]
+
+
+def _one_hot(node, inputs, attrs, opset):
+    indices, depth, values = inputs
+    depth = int(np.asarray(depth).reshape(-1)[0])
+    axis = attrs.get('axis', -1)
+    indices = np.where(indices < 0, indices + depth, indices).astype(np.int64)
+    hot = np.arange(depth) == indices[..., None]
+    result = np.where(hot, values[1], values[0])
+    return [np.moveaxis(result, -1, axis)]
+
+
+def _bit_shift(node, inputs, attrs, opset):
+    direction = _decode(attrs['direction'])
+    op = np.left_shift if direction == 'LEFT' else np.right_shift
+    return [op(inputs[0], inputs[1])]
+
+
+def _random(normal, like):
+    def kernel(node, inputs, attrs, opset):
+        rng = np.random.default_rng(int(attrs['seed']) if 'seed' in attrs else None)
+        shape = inputs[0].shape if like else list(attrs['shape'])
+        if normal:
+            values = rng.normal(attrs.get('mean', 0.0), attrs.get('scale', 1.0), shape)
+        else:
+            values = rng.uniform(attrs.get('low', 0.0), attrs.get('high', 1.0), shape)
+        return [values.astype(np.float32)]
+    return kernel
+
+
+def _div(a, b):
+    if np.issubdtype(a.dtype, np.integer):
+        # ONNX Div для целых - деление с отбрасыванием дробной части
+        return (np.trunc(a / b)).astype(a.dtype)
+    return a / b
+
+
+KERNELS = {
+    # Тензорные операторы
+    'Cast': _cast, 'Concat': _concat, 'ConstantOfShape': _constant_of_shape, 'Expand': _expand,
+    'Flatten': _flatten, 'Gather': _gather, 'Identity': _unary(lambda x: x), 'OneHot': _one_hot,
+    'Reshape': _reshape, 'Slice': _slice, 'Split': _split, 'Squeeze': _squeeze, 'Tile': _tile,
+    'Transpose': _transpose, 'Unsqueeze': _unsqueeze, 'Shape': _shape, 'Pad': _pad, 'Resize': _resize,
+    # Математика
+    'Add': _binary(np.add), 'Sub': _binary(np.subtract), 'Mul': _binary(np.multiply), 'Div': _binary(_div),
+    'Pow': _binary(lambda a, b: np.power(a, b).astype(a.dtype)), 'BitShift': _bit_shift,
+    'MatMul': _binary(np.matmul), 'Gemm': _gemm,
+    'Max': _variadic(np.maximum), 'Min': _variadic(np.minimum), 'Sum': _variadic(np.add),
+    'Mean': lambda node, inputs, attrs, opset: [(sum(inputs) / len(inputs)).astype(inputs[0].dtype)],
+    'Exp': _unary(np.exp), 'Log': _unary(np.log), 'Neg': _unary(np.negative), 'Sqrt': _unary(np.sqrt),
+    'Sign': _unary(np.sign), 'Sin': _unary(np.sin), 'Tanh': _unary(np.tanh), 'Erf': _unary(_erf),
+    'Relu': _unary(lambda x: np.maximum(x, 0).astype(x.dtype)),
+    'Sigmoid': _unary(lambda x: (1 / (1 + np.exp(-x))).astype(x.dtype)),
+    'Softplus': _unary(lambda x: np.logaddexp(0, x).astype(x.dtype)),
+    'Softsign': _unary(lambda x: (x / (1 + np.abs(x))).astype(x.dtype)),
+    'Softmax': _softmax, 'Clip': _clip, 'Where': _where,
+    'ReduceSum': _reduce(np.sum, input_axes_since=13), 'ReduceMean': _reduce(np.mean),
+    'ReduceMax': _reduce(np.max), 'ReduceMin': _reduce(np.min), 'ReduceProd': _reduce(np.prod),
+    'ReduceL1': _reduce(lambda x, **kw: np.sum(np.abs(x), **kw)),
+    'ReduceL2': _reduce(lambda x, **kw: np.sqrt(np.sum(x * x, **kw))),
+    'ReduceLogSum': _reduce(lambda x, **kw: np.log(np.sum(x, **kw))),
+    'ReduceLogSumExp': _reduce(lambda x, **kw: np.log(np.sum(np.exp(x), **kw))),
+    'ReduceSumSquare': _reduce(lambda x, **kw: np.sum(x * x, **kw)),
+    # Нейросетевые операторы
+    'Conv': _conv, 'ConvTranspose': _conv_transpose,
+    'MaxPool': _pool(reduce_max=True), 'AveragePool': _pool(reduce_max=False),
+    'GlobalAveragePool': _unary(lambda x: x.mean(axis=tuple(range(2, x.ndim)), keepdims=True)),
+    'GlobalMaxPool': _unary(lambda x: x.max(axis=tuple(range(2, x.ndim)), keepdims=True)),
+    'BatchNormalization': _batch_norm, 'InstanceNormalization': _instance_norm,
+    # Логика и сравнения
+    'Equal': _binary(np.equal), 'Greater': _binary(np.greater), 'GreaterOrEqual': _binary(np.greater_equal),
+    'Less': _binary(np.less), 'LessOrEqual': _binary(np.less_equal),
+    'And': _binary(np.logical_and), 'Or': _binary(np.logical_or), 'Xor': _binary(np.logical_xor),
+    'Not': _unary(np.logical_not),
+    'Constant': _constant,
+    'RandomUniform': _random(normal=False, like=False), 'RandomUniformLike': _random(normal=False, like=True),
+    'RandomNormal': _random(normal=True, like=False), 'RandomNormalLike': _random(normal=True, like=True),
+}
+
+
+class ReferenceExecutor:
+    """Выполняет ONNX граф ядрами NumPy с проверками Sentis и профилированием.
+
+    Args:
+        model (onnx.ModelProto | str): Модель или путь к ней.
+        strict (bool): Проверить ограничения Sentis до выполнения и упасть на первом нарушении.
+    """
+
+    def __init__(self, model, strict=True):
+        if isinstance(model, str):
+            model = onnx.load(model)
+        self.model = model
+        self.opset = _opset_version(model)
+        if strict:
+            issues = validate_model(model)
+            if issues:
+                raise SentisCompatibilityError(None, f"{len(issues)} нарушений, первое: {issues[0]}")
+        self.initializers = {i.name: numpy_helper.to_array(i) for i in model.graph.initializer}
+        self.profile = []
+        self.peak_live_bytes = 0
+
+    def _last_use(self):
+        """Индекс последнего узла-потребителя каждого тензора (для освобождения памяти)."""
+        last = {}
+        for index, node in enumerate(self.model.graph.node):
+            for name in node.input:
+                last[name] = index
+        for output in self.model.graph.output:
+            last[output.name] = len(self.model.graph.node)
+        return last
+
+    def run(self, feeds):
+        """Выполняет граф.
+
+        Args:
+            feeds (dict[str, np.ndarray]): Входы графа.
+
+        Returns:
+            dict[str, np.ndarray]: Выходы графа.
+        """
+        values = dict(self.initializers)
+        values.update(feeds)
+        values[''] = None
+        last_use = self._last_use()
+        live_bytes = sum(v.nbytes for v in feeds.values())
+        self.peak_live_bytes = live_bytes
+        self.profile = []
+
+        for index, node in enumerate(self.model.graph.node):
+            kernel = KERNELS.get(node.op_type)
+            if kernel is None or node.domain not in ('', 'ai.onnx'):
+                raise SentisCompatibilityError(node, "оператор не поддерживается эталонным исполнителем")
+            try:
+                inputs = [values[name] for name in node.input]
+            except KeyError as e:
+                raise SentisCompatibilityError(
+                    node, f"вход {e} ещё не вычислен (нарушен топологический порядок)") from None
+            for name, value in zip(node.input, inputs):
+                if value is not None and value.ndim > MAX_RANK:
+                    raise SentisCompatibilityError(node, f"ранг тензора '{name}' больше {MAX_RANK}")
+
+            start = time.perf_counter()
+            outputs = kernel(node, inputs, _attrs(node), self.opset)
+            elapsed = time.perf_counter() - start
+
+            allocated = 0
+            for name, value in zip(node.output, outputs):
+                value = np.asarray(value)
+                if value.dtype not in ALLOWED_DTYPES:
+                    allowed = '/'.join(sorted(dtype.name for dtype in ALLOWED_DTYPES))
+                    raise SentisCompatibilityError(node, f"выход '{name}' имеет тип {value.dtype}, "
+                                                         f"Sentis поддерживает {allowed}")
+                values[name] = value
+                allocated += value.nbytes
+            live_bytes += allocated
+            self.peak_live_bytes = max(self.peak_live_bytes, live_bytes)
+
+            # Освобождаем тензоры, у которых больше нет потребителей
+            for name in set(node.input):
+                if name and last_use.get(name) == index and name not in self.initializers and name not in feeds:
+                    live_bytes -= values.pop(name).nbytes
+
+            self.profile.append({
+                'name': node.name,
+                'op_type': node.op_type,
+                'time_ms': elapsed * 1000.0,
+                'allocated_bytes': allocated,
+                'output_shapes': [list(np.shape(values.get(name))) for name in node.output],
+            })
+
+        return {output.name: values[output.name] for output in self.model.graph.output}
+
+    def profile_by_op(self):
+        """Суммарное время и выделенная память по типам операторов, по убыванию времени."""
+        summary = {}
+        for entry in self.profile:
+            item = summary.setdefault(entry['op_type'], {'count': 0, 'time_ms': 0.0, 'allocated_bytes': 0})
+            item['count'] += 1
+            item['time_ms'] += entry['time_ms']
+            item['allocated_bytes'] += entry['allocated_bytes']
+        return dict(sorted(summary.items(), key=lambda kv: -kv[1]['time_ms']))
+
+
+def print_profile(executor, top=10):
+    """Печатает профиль последнего запуска по типам операторов и самые дорогие узлы."""
+    total_ms = sum(entry['time_ms'] for entry in executor.profile) or 1e-9
+    print(f"\nПрофиль по операторам (всего {total_ms:.1f} мс, пик живых тензоров "
+          f"{executor.peak_live_bytes / (1024 * 1024):.1f} МБ):")
+    print(f"  {'оператор':<22} {'узлов':>6} {'мс':>10} {'%':>6} {'выделено, МБ':>13}")
+    for op_type, item in executor.profile_by_op().items():
+        print(f"  {op_type:<22} {item['count']:>6} {item['time_ms']:>10.2f} "
+              f"{item['time_ms'] / total_ms * 100:>6.1f} {item['allocated_bytes'] / (1024 * 1024):>13.2f}")
+    print(f"\nСамые дорогие узлы (топ {top}):")
+    for entry in sorted(executor.profile, key=lambda e: -e['time_ms'])[:top]:
+        print(f"  {entry['time_ms']:>9.2f} мс  {entry['op_type']:<14} {entry['name']}  -> {entry['output_shapes']}")
+
+
+def run_reference(model_path, height=None, width=None, compare=False, top=10, batch_size=None, corpus=None):
+    """Проверяет модель на ограничения Sentis, выполняет её на NumPy и печатает профиль.
+
+    Args:
+        model_path (str): Путь к модели ONNX.
+        height (int | None): Высота входа, если во входе графа она динамическая.
+        width (int | None): Ширина входа, если во входе графа она динамическая.
+        compare (bool): Сверить выход с onnxruntime.
+        top (int): Сколько самых дорогих узлов выводить.
+        batch_size (int | None): Размер батча, если батч во входе графа динамический
+            (по умолчанию - число кадров корпуса или 1).
+        corpus (str | None): Директория корпуса input_corpus.py вместо тестового градиента;
+            если кадров меньше батча, они повторяются по кругу.
+
+    Returns:
+        bool: True, если граф выполнился без нарушений (и совпал с onnxruntime при сверке).
+    """
+    from inspect_onnx_model import make_input_tensor, make_test_image
+
+    print(f"Эталонное выполнение модели: {model_path}")
+    model = onnx.load(model_path)
+    issues = validate_model(model)
+    if issues:
+        print(f"\n❌ Найдено нарушений ограничений Sentis: {len(issues)}")
+        for issue in issues:
+            print(f"  - {issue}")
+        return False
+    print("✅ Статическая проверка ограничений Sentis пройдена")
+
+    graph_input = model.graph.input[0]
+    dims = [d.dim_value or None for d in graph_input.type.tensor_type.shape.dim]
+    height = dims[2] or height or 320
+    width = dims[3] or width or 320
+    frames = None
+    if corpus is not None:
+        from input_corpus import InputCorpus
+        frames = InputCorpus(corpus)
+        if len(frames) == 0:
+            print(f"Ошибка: корпус {corpus} пуст, нет кадров для входа")
+            return False
+    if dims[0] and batch_size and batch_size != dims[0]:
+        print(f"⚠️ Батч во входе графа статический ({dims[0]}), --batch-size {batch_size} игнорируется")
+    batch_size = dims[0] or batch_size or (len(frames) if frames is not None else 1)
+    if frames is None:
+        input_tensor = np.repeat(make_input_tensor(make_test_image(height, width)), batch_size, axis=0)
+    else:
+        array = frames.array(height, width)
+        indices = np.arange(batch_size) % len(array)
+        input_tensor = np.ascontiguousarray(array[indices], dtype=np.float32)
+    print(f"Вход {graph_input.name}: {input_tensor.shape}")
+
+    executor = ReferenceExecutor(model, strict=False)
+    try:
+        start = time.perf_counter()
+        outputs = executor.run({graph_input.name: input_tensor})
+        elapsed = time.perf_counter() - start
+    except SentisCompatibilityError as e:
+        print(f"\n❌ Выполнение остановлено: {e}")
+        return False
+    print(f"✅ Граф выполнен за {elapsed:.2f} с")
+    for name, value in outputs.items():
+        print(f"  {name}: {value.shape}, {value.dtype}, мин {value.min():.4f}, макс {value.max():.4f}")
+    print_profile(executor, top)
+
+    if compare:
+        from inspect_onnx_model import create_session
+        session = create_session(model_path)
+        reference = session.run(None, {graph_input.name: input_tensor})
+        worst = 0.0
+        for (name, value), expected in zip(outputs.items(), reference):
+            diff = float(np.abs(value.astype(np.float64) - expected).max())
+            worst = max(worst, diff)
+            print(f"\nСверка с onnxruntime [{name}]: max|Δ| = {diff:.3e}")
+        if worst > 1e-3:
+            print("❌ Расхождение с onnxruntime больше 1e-3")
+            return False
+    return True
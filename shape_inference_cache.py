@@ -0,0 +1,420 @@
+#!/usr/bin/env python3
+"""
+Инкрементальный вывод форм и типов ONNX с кэшем по узлам.
+
+onnx.shape_inference.infer_shapes и onnx.checker.check_model всегда
+обходят всю модель, и на SegFormer после каждого прохода оптимизации это
+становится основной частью времени. Здесь вывод идет по одному узлу
+(onnx.shape_inference.infer_node_outputs), а результат запоминается:
+
+- у каждого узла хранится отпечаток (сериализованный NodeProto); refresh()
+  заново выводит только измененные узлы и их нисходящий конус, причем конус
+  обрывается, как только выведенные типы выхода совпали с прежними;
+- результаты вывода кэшируются по сигнатуре узла (оператор, атрибуты, типы
+  и константные значения входов) без учета имен, поэтому одинаковые блоки
+  энкодера и повторные проходы берут их из кэша, который можно передать
+  между моделями;
+- небольшие целочисленные значения (Shape -> Gather -> Concat -> Reshape)
+  вычисляются ядрами sentis_reference_executor, чтобы выводились формы
+  после Reshape, Expand, Resize;
+- validate() проверяет onnx.checker.check_node только измененные узлы.
+
+Граф должен быть топологически отсортирован (см. fix_topological_order.py).
+"""
+import os
+import time
+from collections import Counter
+
+import numpy as np
+import onnx
+from onnx import helper, numpy_helper
+
+from graph_rewrite import DEFAULT_DOMAINS, is_topologically_sorted
+from pipeline_telemetry import start_stage
+
+# Константные значения длиннее этого не распространяются (это уже веса, а не формы)
+MAX_PROPAGATED_ELEMENTS = 1024
+PROPAGATED_DTYPES = (np.int32, np.int64)
+# Дешевые операторы над формами, которые вычисляются при известных входах
+PROPAGATED_OPS = {'Cast', 'Concat', 'Constant', 'Gather', 'Identity', 'Reshape', 'Slice', 'Squeeze',
+                  'Unsqueeze', 'Add', 'Sub', 'Mul', 'Div', 'Equal', 'Where', 'Max', 'Min'}
+
+
+def _propagated(array):
+    array = np.asarray(array)
+    return (array if array.dtype in PROPAGATED_DTYPES and array.size <= MAX_PROPAGATED_ELEMENTS
+            else None)
+
+
+def _tensor_type(elem_type, dims):
+    return helper.make_tensor_type_proto(elem_type, list(dims))
+
+
+def _static_shape(type_proto):
+    """Форма тензора как список int, если все размеры известны, иначе None."""
+    if not type_proto.tensor_type.HasField('shape'):
+        return None
+    dims = type_proto.tensor_type.shape.dim
+    if not all(dim.HasField('dim_value') for dim in dims):
+        return None
+    return [dim.dim_value for dim in dims]
+
+
+def format_type(type_proto):
+    """'float32[1, 3, 512, 512]' для отчетов; неизвестные размеры - именами или '?'."""
+    tensor_type = type_proto.tensor_type
+    dtype = helper.tensor_dtype_to_np_dtype(tensor_type.elem_type).name if tensor_type.elem_type else '?'
+    if not tensor_type.HasField('shape'):
+        return f"{dtype}[...]"
+    dims = [str(dim.dim_value) if dim.HasField('dim_value') else (dim.dim_param or '?')
+            for dim in tensor_type.shape.dim]
+    return f"{dtype}[{', '.join(dims)}]"
+
+
+class ShapeInferenceCache:
+    """Кэш выведенных типов значений графа с инкрементальным обновлением.
+
+    Args:
+        model (onnx.ModelProto): Модель; изменяется вызывающим кодом, кэш
+            замечает изменения при следующем refresh().
+        memo (dict | None): Кэш результатов по сигнатуре узла; можно передать
+            общий словарь нескольким моделям или вариантам одной модели.
+    """
+
+    def __init__(self, model, memo=None):
+        self.model = model
+        self.memo = {} if memo is None else memo
+        self.types = {}
+        self.data = {}
+        self.errors = {}
+        self.stats = Counter()
+        self._fingerprints = {}
+        self._sources = {}
+        self._dirty = set()
+        self._opsets = {}
+
+    def _source_values(self):
+        """Типы и константы входов графа и инициализаторов: {имя: (сигнатура, тип, значение)}."""
+        sources = {}
+        for value in self.model.graph.input:
+            type_proto = onnx.TypeProto()
+            type_proto.CopyFrom(value.type)
+            sources[value.name] = (type_proto.SerializeToString(), type_proto, None)
+        for init in self.model.graph.initializer:
+            type_proto = _tensor_type(init.data_type, init.dims)
+            data = None
+            if len(init.dims) <= 1 and np.prod(init.dims, dtype=np.int64) <= MAX_PROPAGATED_ELEMENTS:
+                data = _propagated(numpy_helper.to_array(init))
+            # Веса сравниваются по типу и форме: их значения на выводимые формы не влияют
+            signature = type_proto.SerializeToString() + (data.tobytes() if data is not None else b'')
+            sources[init.name] = (signature, type_proto, data)
+        return sources
+
+    def _schema(self, node):
+        domain = node.domain or ''
+        version = self._opsets.get('' if domain in DEFAULT_DOMAINS else domain)
+        if version is None:
+            return None
+        try:
+            return onnx.defs.get_schema(node.op_type, version, domain)
+        except onnx.defs.SchemaError:
+            return None
+
+    def _signature(self, node):
+        """Ключ кэша без имен: одинаковые узлы с одинаковыми входами дают один результат."""
+        version = self._opsets.get('' if node.domain in DEFAULT_DOMAINS else node.domain)
+        parts = [node.domain.encode(), node.op_type.encode(), f"{version}:{len(node.output)}".encode()]
+        parts.extend(attr.SerializeToString() for attr in sorted(node.attribute, key=lambda a: a.name))
+        for name in node.input:
+            type_proto = self.types.get(name)
+            parts.append(type_proto.SerializeToString() if type_proto is not None else b'-')
+            data = self.data.get(name)
+            parts.append(data.dtype.str.encode() + data.tobytes() if data is not None else b'-')
+        return b'\x00'.join(parts)
+
+    def _infer_node(self, node):
+        """[(тип | None, значение | None)] по выходам и сообщение об ошибке."""
+        signature = self._signature(node)
+        cached = self.memo.get(signature)
+        if cached is not None:
+            self.stats['memo_hits'] += 1
+            return cached
+        self.stats['inferred'] += 1
+
+        error = None
+        outputs = [(None, None)] * len(node.output)
+        schema = self._schema(node)
+        if schema is None:
+            self.stats['unknown_ops'] += 1
+        elif any(name and name not in self.types for name in node.input):
+            # Тип входа неизвестен (выше по графу нестандартный оператор): выходы тоже неизвестны
+            self.stats['unknown_inputs'] += 1
+        else:
+            input_types = {name: self.types[name] for name in node.input if name in self.types}
+            input_data = {name: numpy_helper.from_array(self.data[name], name)
+                          for name in node.input if name in self.data}
+            try:
+                inferred = onnx.shape_inference.infer_node_outputs(
+                    schema, node, input_types, input_data, opset_imports=list(self.model.opset_import),
+                    ir_version=self.model.ir_version)
+                outputs = [(inferred.get(name), None) for name in node.output]
+            except Exception as e:
+                error = str(e).strip().splitlines()[-1] if str(e).strip() else type(e).__name__
+            outputs = self._propagate_data(node, outputs)
+
+        result = (outputs, error)
+        self.memo[signature] = result
+        return result
+
+    def _propagate_data(self, node, outputs):
+        """Значения выходов для операторов над формами, если все входы известны."""
+        if node.domain not in DEFAULT_DOMAINS:
+            return outputs
+        if node.op_type == 'Shape':
+            shape = _static_shape(self.types[node.input[0]]) if node.input[0] in self.types else None
+            if shape is None:
+                return outputs
+            attrs = {attr.name: helper.get_attribute_value(attr) for attr in node.attribute}
+            value = np.array(shape, dtype=np.int64)[attrs.get('start', 0):attrs.get('end', len(shape))]
+            return [(outputs[0][0], value)]
+        if node.op_type not in PROPAGATED_OPS:
+            return outputs
+        if any(name and name not in self.data for name in node.input):
+            return outputs
+        if node.op_type == 'Constant' and not any(attr.name == 'value' for attr in node.attribute):
+            return outputs
+        from sentis_reference_executor import KERNELS, _attrs
+
+        try:
+            values = KERNELS[node.op_type](node, [self.data.get(name) for name in node.input],
+                                           _attrs(node), self._opsets.get('', 0))
+        except Exception:
+            return outputs
+        return [(type_proto, _propagated(value)) for (type_proto, _), value in zip(outputs, values)]
+
+    def refresh(self):
+        """Обновляет кэш после изменений модели.
+
+        Изменения находятся сравнением отпечатков, поэтому каждый вызов
+        сериализует все узлы: даже refresh() без изменений стоит O(размер графа),
+        хотя это на порядки дешевле вывода типов (миллисекунды на тысячи узлов).
+        Заново выводятся только измененные узлы и их конус.
+
+        Returns:
+            dict: changed - измененных/новых узлов, reinferred - выведено заново
+                (вместе с конусом), elapsed_s - время.
+        """
+        start = time.perf_counter()
+        graph = self.model.graph
+        self._opsets = {('' if o.domain in DEFAULT_DOMAINS else o.domain): o.version
+                        for o in self.model.opset_import}
+        opset_signature = tuple(sorted(self._opsets.items()))
+        if self._sources.get(None) != opset_signature:
+            # Другой opset меняет схемы всех узлов: начинаем заново
+            self._fingerprints = {}
+
+        changed_values = set()
+        orphaned = set()
+        sources = self._source_values()
+        for name, (signature, type_proto, data) in sources.items():
+            previous = self._sources.get(name)
+            if previous is None or previous[0] != signature:
+                changed_values.add(name)
+                self.types[name] = type_proto
+                if data is None:
+                    self.data.pop(name, None)
+                else:
+                    self.data[name] = data
+        orphaned.update(set(self._sources) - set(sources) - {None})
+        self._sources = {None: opset_signature, **sources}
+
+        fingerprints = {tuple(node.output): node.SerializeToString() for node in graph.node}
+        # Выходы удаленных узлов больше не определены: их потребители выводятся
+        # заново и попадают в проверку validate() (неопределенный вход)
+        removed = set(self._fingerprints) - set(fingerprints)
+        if removed:
+            produced = {name for key in fingerprints for name in key}
+            for key in removed:
+                self.errors.pop(key, None)
+                self._dirty.discard(key)
+                orphaned.update(name for name in key if name not in sources and name not in produced)
+        for name in orphaned:
+            self.types.pop(name, None)
+            self.data.pop(name, None)
+        changed_values.update(orphaned)
+
+        changed = reinferred = 0
+        for node in graph.node:
+            key = tuple(node.output)
+            if self._fingerprints.get(key) != fingerprints[key]:
+                changed += 1
+                self._dirty.add(key)
+            elif not any(name in changed_values for name in node.input):
+                continue
+            elif orphaned and any(name in orphaned for name in node.input):
+                self._dirty.add(key)
+
+            reinferred += 1
+            outputs, error = self._infer_node(node)
+            if error:
+                self.errors[key] = error
+            else:
+                self.errors.pop(key, None)
+            for name, (type_proto, data) in zip(node.output, outputs):
+                previous_type, previous_data = self.types.get(name), self.data.get(name)
+                # Обрыв конуса: потребители пересчитываются, только если выход изменился
+                if (previous_type != type_proto or (previous_data is None) != (data is None)
+                        or (data is not None and not np.array_equal(previous_data, data))):
+                    changed_values.add(name)
+                for store, value in ((self.types, type_proto), (self.data, data)):
+                    if value is None:
+                        store.pop(name, None)
+                    else:
+                        store[name] = value
+        self._fingerprints = fingerprints
+
+        self.stats['refreshes'] += 1
+        return {'changed': changed, 'reinferred': reinferred, 'elapsed_s': time.perf_counter() - start}
+
+    def validate(self):
+        """Проверяет только узлы, измененные с прошлой проверки.
+
+        Returns:
+            list[str]: Проблемы: ошибки check_node и вывода типов, неопределенные
+                входы и повторно определенные выходы.
+        """
+        self.refresh()
+        graph = self.model.graph
+        ctx = onnx.checker.C.CheckerContext()
+        ctx.ir_version = self.model.ir_version
+        ctx.opset_imports = dict(self._opsets)
+        defined = {name for name in self._sources if name is not None}
+        producers = Counter()
+        for node in graph.node:
+            producers.update(name for name in node.output if name)
+
+        issues = []
+        for node in graph.node:
+            key = tuple(node.output)
+            if key in self._dirty:
+                label = f"{node.op_type} '{node.name or key[0]}'"
+                try:
+                    onnx.checker.check_node(node, ctx)
+                except Exception as e:
+                    issues.append(f"{label}: {str(e).strip().splitlines()[0]}")
+                undefined = [name for name in node.input
+                             if name and name not in defined and producers[name] == 0]
+                if undefined:
+                    issues.append(f"{label}: не определены входы {', '.join(undefined)}")
+                duplicated = [name for name in node.output if producers[name] > 1 or name in defined]
+                if duplicated:
+                    issues.append(f"{label}: выходы определены повторно: {', '.join(duplicated)}")
+                self.stats['checked'] += 1
+            if key in self.errors:
+                issues.append(f"{node.op_type} '{node.name or key[0]}': вывод типов: {self.errors[key]}")
+        self._dirty = set()
+        return issues
+
+    def shape(self, name):
+        """Форма значения: список int / str (символьный размер) / None, или None, если тип неизвестен."""
+        type_proto = self.types.get(name)
+        if type_proto is None or not type_proto.tensor_type.HasField('shape'):
+            return None
+        return [dim.dim_value if dim.HasField('dim_value') else (dim.dim_param or None)
+                for dim in type_proto.tensor_type.shape.dim]
+
+    def write_value_info(self):
+        """Записывает выведенные типы промежуточных значений в graph.value_info.
+
+        Returns:
+            int: Число записанных значений.
+        """
+        graph = self.model.graph
+        skip = {value.name for value in graph.input}
+        skip.update(value.name for value in graph.output)
+        skip.update(init.name for init in graph.initializer)
+        del graph.value_info[:]
+        written = 0
+        for node in graph.node:
+            for name in node.output:
+                type_proto = self.types.get(name)
+                if name and name not in skip and type_proto is not None:
+                    value_info = graph.value_info.add()
+                    value_info.name = name
+                    value_info.type.CopyFrom(type_proto)
+                    written += 1
+        return written
+
+
+def infer_model_shapes(input_path, output_path=None, telemetry=None, compare=False):
+    """Этап конвейера: выводит формы всех значений, проверяет узлы и сохраняет value_info.
+
+    Args:
+        input_path (str): Входная модель.
+        output_path (str | None): Куда сохранить модель с value_info (None - не сохранять).
+        telemetry (StageTelemetry | None): Куда записать метрики.
+        compare (bool): Сравнить время и результат с onnx.shape_inference.infer_shapes.
+    """
+    telemetry = start_stage(telemetry)
+    if not os.path.exists(input_path):
+        print(f"Ошибка: Файл модели не найден: {input_path}")
+        return False
+    model = onnx.load(input_path)
+    telemetry.lap('load')
+    telemetry.record_model('input', model)
+    if not is_topologically_sorted(model.graph):
+        print("Ошибка: граф не отсортирован топологически, сначала выполните sort")
+        return False
+
+    cache = ShapeInferenceCache(model)
+    first = cache.refresh()
+    issues = cache.validate()
+    telemetry.lap('infer')
+    values = sum(len(node.output) for node in model.graph.node)
+    known = sum(1 for node in model.graph.node for name in node.output if name in cache.types)
+    static = sum(1 for node in model.graph.node for name in node.output
+                 if name in cache.types and _static_shape(cache.types[name]) is not None)
+    print(f"Выведены типы {known} из {values} значений ({static} со статической формой) "
+          f"за {first['elapsed_s'] * 1000:.0f} мс; выведено узлов: {cache.stats['inferred']}, "
+          f"из кэша сигнатур: {cache.stats['memo_hits']}")
+
+    # Повторный проход без изменений - стоимость проверки "ничего не изменилось"
+    second = cache.refresh()
+    print(f"Повторное обновление без изменений: {second['elapsed_s'] * 1000:.1f} мс, "
+          f"выведено заново: {second['reinferred']}")
+
+    for output in model.graph.output:
+        if output.name in cache.types:
+            print(f"  выход {output.name}: {format_type(cache.types[output.name])}")
+    if issues:
+        print(f"⚠️ Найдено проблем: {len(issues)}")
+        for issue in issues[:20]:
+            print(f"  {issue}")
+    else:
+        print("✅ Все узлы прошли проверку")
+
+    if compare:
+        start = time.perf_counter()
+        full = onnx.shape_inference.infer_shapes(model)
+        full_s = time.perf_counter() - start
+        reference = {value.name: value.type for value in full.graph.value_info}
+        differs = [name for name, type_proto in reference.items()
+                   if name in cache.types and cache.types[name] != type_proto]
+        print(f"onnx.shape_inference.infer_shapes: {full_s * 1000:.0f} мс, значений {len(reference)}, "
+              f"отличаются: {len(differs)}")
+        for name in differs[:10]:
+            print(f"  {name}: {format_type(cache.types[name])} против {format_type(reference[name])}")
+    telemetry.lap('compare')
+
+    if output_path:
+        written = cache.write_value_info()
+        onnx.save(model, output_path)
+        print(f"Модель с value_info ({written} значений) сохранена в {output_path}")
+        telemetry.record_model('output', model)
+        telemetry.lap('save')
+    telemetry.record(values_inferred=known, values_static=static, validation_issues=len(issues))
+    return not issues
+
+
+if __name__ == "__main__":
+    infer_model_shapes(os.path.join('Assets', 'StreamingAssets', 'model_unity_final.onnx'), compare=True)
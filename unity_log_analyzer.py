@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+Анализ производительности по журналам Unity (player/editor, logcat, MSBuild, mono_crash).
+
+Журналы читаются потоково, построчно, поэтому многомегабайтные логи
+устройства не загружаются в память целиком. Из сообщений Debug.Log
+WallSegmentation и соседних скриптов извлекаются:
+
+- время обработки сегментации ("⏱️ Время обработки сегментации: 23.4ms, ...");
+- смены разрешения адаптивной системы (WallSegmentation, GPUSegmentationProcessor,
+  SegmentationVisualizer) и FPS из этих сообщений;
+- формы входных и выходных тензоров;
+- ошибки и предупреждения (Unity, исключения, MSBuild/C# коды).
+
+Каждый запуск приложения внутри журнала (заголовок Unity) - отдельная
+сессия. Для неё строятся гистограмма задержек (границы 16/33/50 мс как в
+CriticalFixesValidator) и статистика с теми же ключами, что у
+inspect_onnx_model.benchmark_model (mean, median, p90, min, max), в том числе
+по каждому разрешению - их можно сравнить с офлайн бенчмарком onnxruntime
+из журнала запусков. Временная шкала кадров сохраняется в CSV.
+"""
+import csv
+import gzip
+import json
+import os
+import re
+from collections import Counter, defaultdict
+
+import numpy as np
+
+# Границы гистограммы задержек, мс (16/33/50 - пороги CriticalFixesValidator)
+HISTOGRAM_BINS_MS = (8, 16, 33, 50, 100, 200)
+
+DEFAULT_LOGS = ('build.log', 'compile.log', 'mono_crash.*.json')
+
+# Префиксы строк: logcat ("05-23 11:15:33.141  5744  5760 I Unity   : ...") и ISO время
+_LOGCAT_RE = re.compile(r'^(\d\d-\d\d \d\d:\d\d:\d\d\.\d+)\s+\d+\s+\d+\s+[VDIWEF]\s+Unity\s*:\s?(.*)$')
+_TIMESTAMP_RE = re.compile(r'^\[?(\d{4}-\d\d-\d\d[ T]\d\d:\d\d:\d\d(?:\.\d+)?)\]?\s*(.*)$')
+
+_SESSION_RE = re.compile(r'^(Unity Editor version:|Initialize engine version:|Сборка начата|Build started)')
+_NUMBER = r'(\d+(?:[.,]\d+)?)'
+# Vector2Int.ToString() -> "(512, 512)", в других сообщениях "512x512"
+_RESOLUTION = r'\(?(\d+)\s*(?:,|x|×)\s*(\d+)\)?'
+
+_PROCESSING_RE = re.compile(r'Время обработки сегментации:\s*' + _NUMBER + r'\s*ms'
+                            r'(?:.*?текущее разрешение:\s*' + _RESOLUTION + r')?')
+_INFERENCE_RE = re.compile(r'(?:[Ii]nference|[Ии]нференс\w*|Execute\w*)\D{0,40}?' + _NUMBER + r'\s*(?:ms|мс)\b')
+_RESOLUTION_CHANGE_RE = re.compile(
+    r'(?:(?P<up>Увеличение|Increased)|(?P<down>Уменьшение|Reduced))\s+(?:разрешения|resolution|quality)'
+    r'(?::\s*' + _RESOLUTION + r'\s*→\s*|\s+to\s+)' + r'\(?(?P<w>\d+)\s*(?:,|x)\s*(?P<h>\d+)\)?'
+    r'(?:.*?время:\s*(?P<time>' + _NUMBER[1:-1] + r')ms)?(?:.*?FPS:\s*(?P<fps>' + _NUMBER[1:-1] + r'))?')
+# "Установлено фиксированное разрешение: (512, 512)", "✅ Пересозданы текстуры с разрешением (512, 512)"
+_FIXED_RESOLUTION_RE = re.compile(r'(?:фиксированное разрешение|текстуры с разрешением):?\s*' + _RESOLUTION)
+_FPS_RE = re.compile(r'FPS:\s*' + _NUMBER)
+_SHAPE_RE = re.compile(r'(?P<kind>Входной тензор создан|с тензором|Форма|outputShape|output tensor \(base\))'
+                       r'[^(\[]{0,20}[(\[]\s*(?P<dims>\d+(?:\s*,\s*\d+)+)\s*[)\]]')
+_BUILD_CODE_RE = re.compile(r'\b(?P<level>error|warning)\s+(?P<code>[A-Z]{2,}\d+)\s*:\s*(?P<message>.*)')
+_ERROR_RE = re.compile(r'(Fatal Error|Exception\b|\bError\b|\berror\b|Ошибка|ошибка|❌)')
+_WARNING_RE = re.compile(r'(\bWarning\b|\bwarning\b|ПРЕДУПРЕЖДЕНИЕ|⚠️)')
+# Подробный журнал MSBuild упоминает задачи Error/Warning, даже когда они не выполнялись
+_BUILD_NOISE_RE = re.compile(r'(пропущена из-за невыполненного условия|skipped due to false condition|'
+                             r'[Зз]адача "(?:Error|Warning)"|[Tt]ask "(?:Error|Warning)")')
+
+
+def _number(text):
+    return float(text.replace(',', '.'))
+
+
+def _normalize_message(message, limit=120):
+    """Убирает числа и хвост с путем проекта, чтобы одинаковые сообщения сгруппировались."""
+    message = re.sub(r'\s*\[[^\]]*\.(?:cs|vb)?proj\]\s*$', '', message.strip())
+    return re.sub(r'\d+(?:[.,]\d+)?', '#', message)[:limit]
+
+
+class LogSession:
+    """События одной сессии журнала (один запуск Unity / одна сборка)."""
+
+    def __init__(self, source, index, start_line):
+        self.source = source
+        self.index = index
+        self.start_line = start_line
+        self.header = None
+        self.resolution = None
+        self.timeline = []  # dict: line, timestamp, kind, processing_ms, fps, width, height
+        self.resolution_changes = []
+        self.shapes = defaultdict(Counter)
+        self.errors = Counter()
+        self.warnings = Counter()
+        self.first_seen = {}
+
+    @property
+    def name(self):
+        return f"{os.path.basename(self.source)}#{self.index}"
+
+    def latencies(self, resolution=None):
+        return [event['processing_ms'] for event in self.timeline
+                if event.get('processing_ms') is not None
+                and (resolution is None or (event['width'], event['height']) == resolution)]
+
+    def resolutions(self):
+        return sorted({(e['width'], e['height']) for e in self.timeline
+                       if e.get('processing_ms') is not None and e['width'] is not None})
+
+    def is_empty(self):
+        return not (self.timeline or self.resolution_changes or self.shapes or self.errors or self.warnings)
+
+
+def iter_log_lines(path):
+    """Генерирует (номер строки, время или None, сообщение), не читая файл целиком."""
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', errors='replace') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.rstrip('\r\n')
+            match = _LOGCAT_RE.match(line) or _TIMESTAMP_RE.match(line)
+            if match:
+                yield line_no, match.group(1), match.group(2)
+            else:
+                yield line_no, None, line
+
+
+def _add_event(session, line_no, timestamp, kind, processing_ms=None, fps=None):
+    width, height = session.resolution or (None, None)
+    session.timeline.append({'line': line_no, 'timestamp': timestamp, 'kind': kind,
+                             'processing_ms': processing_ms, 'fps': fps,
+                             'frame_ms': 1000.0 / fps if fps else None,
+                             'width': width, 'height': height})
+
+
+def _count(session, counter, key, line_no):
+    counter[key] += 1
+    session.first_seen.setdefault(key, line_no)
+
+
+def parse_log(path):
+    """Разбирает текстовый журнал Unity/MSBuild в список сессий."""
+    sessions = [LogSession(path, 1, 1)]
+    for line_no, timestamp, message in iter_log_lines(path):
+        session = sessions[-1]
+        if _SESSION_RE.match(message):
+            if not session.is_empty() or session.header is not None:
+                session = LogSession(path, len(sessions) + 1, line_no)
+                sessions.append(session)
+            session.header = message.strip()
+            continue
+
+        # Дешевые проверки подстрок перед регулярными выражениями: строк миллионы
+        if 'ms' in message or 'мс' in message:
+            match = _PROCESSING_RE.search(message)
+            if match:
+                if match.group(2):
+                    session.resolution = (int(match.group(2)), int(match.group(3)))
+                _add_event(session, line_no, timestamp, 'processing', processing_ms=_number(match.group(1)))
+                continue
+            match = _INFERENCE_RE.search(message)
+            if match and 'Целевое' not in message and 'целевое' not in message:
+                _add_event(session, line_no, timestamp, 'inference', processing_ms=_number(match.group(1)))
+
+        if 'разрешени' in message or 'resolution' in message or 'quality' in message:
+            match = _RESOLUTION_CHANGE_RE.search(message)
+            if match:
+                previous = session.resolution
+                session.resolution = (int(match.group('w')), int(match.group('h')))
+                fps = _number(match.group('fps')) if match.group('fps') else None
+                session.resolution_changes.append({
+                    'line': line_no, 'timestamp': timestamp, 'direction': 'up' if match.group('up') else 'down',
+                    'from': previous, 'to': session.resolution, 'fps': fps,
+                    'avg_processing_ms': _number(match.group('time')) if match.group('time') else None,
+                })
+                _add_event(session, line_no, timestamp, 'resolution', fps=fps)
+                continue
+            match = _FIXED_RESOLUTION_RE.search(message)
+            if match:
+                session.resolution = (int(match.group(1)), int(match.group(2)))
+
+        if 'FPS:' in message:
+            match = _FPS_RE.search(message)
+            if match:
+                _add_event(session, line_no, timestamp, 'fps', fps=_number(match.group(1)))
+
+        if '(' in message or '[' in message:
+            match = _SHAPE_RE.search(message)
+            if match:
+                kind = 'input' if match.group('kind') in ('Входной тензор создан', 'с тензором') else 'output'
+                dims = tuple(int(d) for d in match.group('dims').split(','))
+                session.shapes[kind][dims] += 1
+
+        match = _BUILD_CODE_RE.search(message)
+        if match:
+            key = f"{match.group('code')}: {_normalize_message(match.group('message'), 80)}"
+            _count(session, session.errors if match.group('level') == 'error' else session.warnings, key, line_no)
+        elif _BUILD_NOISE_RE.search(message):
+            continue
+        elif _ERROR_RE.search(message):
+            _count(session, session.errors, _normalize_message(message), line_no)
+        elif _WARNING_RE.search(message):
+            _count(session, session.warnings, _normalize_message(message), line_no)
+
+    return [session for session in sessions if not session.is_empty() or session.header]
+
+
+def parse_mono_crash(path):
+    """Краткая сводка mono_crash JSON: память, GC, упавший поток и управляемые кадры."""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        report = json.load(f)
+    memory = report.get('memory', {})
+    threads = report.get('threads', [])
+    crashed = [thread for thread in threads if thread.get('crashed')]
+    managed_frames = []
+    for thread in crashed or threads[:1]:
+        for frame in thread.get('managed_frames', []):
+            method = frame.get('method_name') or frame.get('sig')
+            if method:
+                managed_frames.append(f"{frame.get('class_name', '')}.{method}".lstrip('.'))
+    return {
+        'source': path,
+        'runtime': report.get('configuration', {}).get('version'),
+        'architecture': report.get('configuration', {}).get('architecture'),
+        'resident_bytes': int(memory.get('Resident Size', 0) or 0),
+        'major_gc_count': int(memory.get('major_gc_count', 0) or 0),
+        'major_gc_time_ms': int(memory.get('major_gc_time', 0) or 0) / 1000.0,
+        'threads': len(threads),
+        'crashed_threads': [thread.get('thread_name') or thread.get('native_thread_id') for thread in crashed],
+        'managed_frames': managed_frames[:10],
+    }
+
+
+def latency_stats(values):
+    """Статистика с теми же ключами, что у benchmark_model."""
+    values = np.asarray(values, dtype=np.float64)
+    return {
+        'count': int(values.size),
+        'mean': float(values.mean()),
+        'median': float(np.median(values)),
+        'p90': float(np.percentile(values, 90)),
+        'min': float(values.min()),
+        'max': float(values.max()),
+    }
+
+
+def latency_histogram(values, bins=HISTOGRAM_BINS_MS):
+    """[(подпись интервала, число значений)]."""
+    counts = np.bincount(np.searchsorted(bins, values, side='right'), minlength=len(bins) + 1)
+    labels = [f"<{bins[0]}"] + [f"{lo}-{hi}" for lo, hi in zip(bins, bins[1:])] + [f">={bins[-1]}"]
+    return list(zip(labels, counts.tolist()))
+
+
+def _format_stats(stats):
+    return (f"n={stats['count']}, среднее {stats['mean']:.1f} мс, медиана {stats['median']:.1f} мс, "
+            f"p90 {stats['p90']:.1f} мс, мин {stats['min']:.1f}, макс {stats['max']:.1f}")
+
+
+def print_session_report(session, top_errors=5):
+    print(f"\n=== {session.name} (строка {session.start_line}) ===")
+    if session.header:
+        print(f"  {session.header}")
+
+    latencies = session.latencies()
+    if latencies:
+        print(f"  Задержка обработки: {_format_stats(latency_stats(latencies))}")
+        histogram = latency_histogram(latencies)
+        peak = max(count for _, count in histogram) or 1
+        for label, count in histogram:
+            print(f"    {label:>8} мс | {'█' * round(30 * count / peak):<30} {count}")
+        for resolution in session.resolutions():
+            print(f"    {resolution[0]}x{resolution[1]}: {_format_stats(latency_stats(session.latencies(resolution)))}")
+
+    fps = [event['fps'] for event in session.timeline if event.get('fps')]
+    if fps:
+        frame_ms = 1000.0 / np.asarray(fps)
+        print(f"  FPS: среднее {np.mean(fps):.1f}, время кадра медиана {np.median(frame_ms):.1f} мс, "
+              f"макс {frame_ms.max():.1f} мс")
+    if session.resolution_changes:
+        up = sum(1 for change in session.resolution_changes if change['direction'] == 'up')
+        print(f"  Смены разрешения: {len(session.resolution_changes)} (вверх {up}, "
+              f"вниз {len(session.resolution_changes) - up}), последнее: "
+              f"{session.resolution_changes[-1]['to'][0]}x{session.resolution_changes[-1]['to'][1]}")
+    for kind, shapes in session.shapes.items():
+        described = ', '.join(f"{list(shape)} ×{count}" for shape, count in shapes.most_common(3))
+        print(f"  Формы тензоров ({kind}): {described}")
+    for title, counter in (('Ошибки', session.errors), ('Предупреждения', session.warnings)):
+        if counter:
+            print(f"  {title}: {sum(counter.values())} ({len(counter)} уникальных)")
+            for message, count in counter.most_common(top_errors):
+                print(f"    ×{count:<5} стр. {session.first_seen[message]:<7} {message}")
+
+
+def print_crash_report(crash):
+    print(f"\n=== {os.path.basename(crash['source'])} ===")
+    print(f"  Mono {crash['runtime']} ({crash['architecture']}), потоков: {crash['threads']}")
+    print(f"  Память: {crash['resident_bytes'] / (1024 * 1024):.0f} МБ резидентно, "
+          f"major GC: {crash['major_gc_count']} за {crash['major_gc_time_ms']:.0f} мс")
+    print(f"  Упавшие потоки: {', '.join(map(str, crash['crashed_threads'])) or 'не отмечены'}")
+    for frame in crash['managed_frames']:
+        print(f"    {frame}")
+
+
+def write_timeline(sessions, path):
+    """Временная шкала событий всех сессий в CSV."""
+    columns = ['session', 'line', 'timestamp', 'kind', 'processing_ms', 'fps', 'frame_ms', 'width', 'height']
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        for session in sessions:
+            for event in session.timeline:
+                writer.writerow({'session': session.name, **event})
+
+
+def compare_with_benchmarks(sessions, run_log):
+    """Сопоставляет задержку на устройстве с последним bench onnxruntime того же разрешения."""
+    from pipeline_telemetry import read_run_log
+
+    offline = {}
+    for record in read_run_log(run_log):
+        shape = record.get('input_shape')
+        if record.get('stage') == 'bench' and record.get('ok') and shape and len(shape) == 4:
+            # В Unity разрешение - (ширина, высота), во входе модели - [N, C, H, W]
+            offline[(shape[3], shape[2])] = record
+    if not offline:
+        print(f"\nВ {run_log} нет записей bench для сравнения")
+        return
+    print(f"\nСравнение с офлайн бенчмарком onnxruntime ({run_log}):")
+    for session in sessions:
+        for resolution in session.resolutions():
+            record = offline.get(resolution)
+            if record is None:
+                continue
+            device = latency_stats(session.latencies(resolution))['median']
+            bench = record['latency_ms']
+            print(f"  {session.name} {resolution[0]}x{resolution[1]}: устройство {device:.1f} мс, "
+                  f"onnxruntime {bench:.1f} мс ({os.path.basename(record.get('input_path') or '')}), "
+                  f"×{device / bench:.2f}")
+
+
+def expand_log_paths(paths):
+    import glob
+
+    expanded = []
+    for pattern in paths:
+        matches = sorted(glob.glob(pattern))
+        expanded.extend(matches if matches else [pattern])
+    return [path for path in expanded if os.path.exists(path)]
+
+
+def analyze_logs(paths=DEFAULT_LOGS, timeline_path=None, run_log=None):
+    """Разбирает журналы, печатает отчет по сессиям и, при необходимости, сохраняет CSV.
+
+    Returns:
+        list[LogSession]: Сессии всех текстовых журналов.
+    """
+    paths = expand_log_paths(paths)
+    if not paths:
+        print("Журналы не найдены")
+        return []
+    sessions = []
+    for path in paths:
+        if path.endswith('.json'):
+            print_crash_report(parse_mono_crash(path))
+            continue
+        size_mb = os.path.getsize(path) / (1024 * 1024)
+        parsed = parse_log(path)
+        print(f"\n{path}: {size_mb:.1f} МБ, сессий: {len(parsed)}")
+        for session in parsed:
+            print_session_report(session)
+        sessions.extend(parsed)
+
+    if timeline_path:
+        write_timeline(sessions, timeline_path)
+        print(f"\nВременная шкала сохранена в {timeline_path}")
+    if run_log and os.path.exists(run_log):
+        compare_with_benchmarks(sessions, run_log)
+    return sessions
+
+
+if __name__ == "__main__":
+    analyze_logs()